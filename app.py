@@ -1,7 +1,8 @@
 import streamlit as st
-import json
-import os
-from pathlib import Path
+from executor import get_executor
+from grading import start_precompute
+from progress_store import get_progress_store
+from utils import get_learner_id
 
 # Setup page configuration
 st.set_page_config(
@@ -11,20 +12,22 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Start the code execution workers now so the first "Run Code" click is fast
+get_executor()
+# Reference outputs for the exercises are computed once, off the request path
+start_precompute()
+
+# Progress is saved per learner, under the id in the page URL
+learner_id = get_learner_id()
+
 # Initialize session state for progress tracking
 if "completed_lessons" not in st.session_state:
-    # Check if a progress file exists and load it
-    progress_file = Path("user_progress.json")
-    if progress_file.exists():
-        with open(progress_file, "r") as f:
-            st.session_state.completed_lessons = json.load(f)
-    else:
-        st.session_state.completed_lessons = {}
+    # Load saved progress (user_progress.json is imported into the store on first use)
+    st.session_state.completed_lessons = get_progress_store().get(learner_id)
 
 # Function to save progress
 def save_progress():
-    with open("user_progress.json", "w") as f:
-        json.dump(st.session_state.completed_lessons, f)
+    get_progress_store().set_many(get_learner_id(), st.session_state.completed_lessons)
 
 # Main page content
 st.title("🐍 Python Learning Platform for Beginners")
@@ -56,6 +59,7 @@ Let's get started by selecting a lesson from the sidebar!
 
 # Display progress
 st.subheader("Your Learning Progress")
+st.caption("Your progress is saved under the link of this page. Bookmark it to continue later.")
 
 # Define all lessons
 lessons = [
@@ -0,0 +1,159 @@
+"""Grade exported submissions outside the app.
+
+    python bulk_grade.py submissions.jsonl verdicts.jsonl [--workers N]
+
+Every input line is a JSON object with "submission_id", "code" and either
+"exercise" (the id from grading.exercise_id, which is also the key of the
+exercise's widgets in the page) or the exercise's "prompt". Exercises are
+read from pages/*.py and graded exactly like the "Check Solution" button
+does, on the executor's worker processes.
+
+Verdicts are appended to the output file as they finish, one JSON line per
+submission. Submissions already in the output file are skipped, so an
+interrupted run can simply be started again.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from executor import get_executor
+from grading import discover_exercises, exercise_id, grade_submission
+from throughput import PROGRESS_INTERVAL, Throughput
+
+
+def read_submissions(path):
+    """Yield the submission record on every line of a JSON Lines file"""
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = {"error": f"line {line_number}: invalid JSON: {e}"}
+            record.setdefault("submission_id", f"line-{line_number}")
+            yield record
+
+
+def graded_ids(path):
+    """Submission ids already present in an output file"""
+    ids = set()
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    ids.add(json.loads(line)["submission_id"])
+                except (ValueError, KeyError):
+                    continue
+    except OSError:
+        pass
+    return ids
+
+
+def grade_record(exercises, record):
+    """Grade one submission record and return its verdict record"""
+    submission_id = record["submission_id"]
+    if "error" in record:
+        return {"submission_id": submission_id, "passed": False, "error": record["error"]}
+    key = record.get("exercise") or exercise_id(record.get("prompt", ""))
+    exercise = exercises.get(key)
+    if exercise is None or "code" not in record:
+        problem = "unknown exercise" if exercise is None else "missing code"
+        return {"submission_id": submission_id, "exercise": key, "passed": False, "error": problem}
+    started = time.perf_counter()
+    verdict = grade_submission(
+        record["code"], exercise.solution_code, exercise.function_name, exercise.test_cases,
+        requires=exercise.requires, benchmark=exercise.benchmark,
+    )
+    result = {
+        "submission_id": submission_id,
+        "exercise": key,
+        "passed": bool(verdict.passed),
+        "exception": verdict.exception,
+        "error": verdict.error or None,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+    if verdict.problems:
+        result["problems"] = list(verdict.problems)
+    if verdict.diff:
+        result["diff"] = verdict.diff
+    if verdict.complexity is not None:
+        result["growth_exponent"] = verdict.complexity.exponent
+        result["within_bound"] = verdict.complexity.within_bound
+    if verdict.report is not None:
+        result["cases"] = [
+            {"args": repr(case.args), "passed": case.passed, "expected": case.expected,
+             "actual": case.actual, "exception": case.exception, "diff": case.diff}
+            for case in verdict.report.cases
+        ]
+        result["skipped"] = verdict.report.skipped
+    return result
+
+
+class Progress(Throughput):
+    """Counts finished submissions and reports throughput"""
+
+    def __init__(self, stream=sys.stderr, interval=PROGRESS_INTERVAL):
+        super().__init__("Graded", "submissions", stream, interval)
+        self.passed = 0
+        self.skipped = 0
+
+    def add(self, result):
+        self.passed += result["passed"]
+        super().add()
+
+    def details(self):
+        return f"{self.passed} passed, {self.skipped} already graded"
+
+
+def grade_file(input_path, output_path, workers, progress=None):
+    """Grade every submission in input_path, appending verdicts to output_path"""
+    exercises = {exercise_id(exercise.prompt): exercise for exercise in discover_exercises()}
+    done_ids = graded_ids(output_path)
+    progress = progress or Progress()
+    # Enough submissions in flight to keep every worker busy, without reading the whole file
+    max_pending = 2 * workers
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_pending) as pool, \
+            open(output_path, "a") as out:
+
+        def write(futures):
+            for future in futures:
+                result = future.result()
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                progress.add(result)
+
+        pending = set()
+        for record in read_submissions(input_path):
+            if record["submission_id"] in done_ids:
+                progress.skipped += 1
+                continue
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                write(done)
+            pending.add(pool.submit(grade_record, exercises, record))
+        write(concurrent.futures.as_completed(pending))
+    progress.report(final=True)
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade exported exercise submissions.")
+    parser.add_argument("input", help="JSON Lines file of submissions")
+    parser.add_argument("output", help="JSON Lines file the verdicts are appended to")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes to grade on (default: number of CPU cores)")
+    args = parser.parse_args(argv)
+    if args.workers:
+        # Read by the executor when it starts its pool
+        os.environ["EXECUTOR_WORKERS"] = str(args.workers)
+    workers = getattr(get_executor(), "size", 1)
+    grade_file(args.input, args.output, workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""LRU cache of compiled code objects for submitted source.
+
+The same snippets are run over and over, so their source is compiled once
+and the code object reused. Syntax errors are reported straight from
+here, before any execution is dispatched. `stats()` shows how often the
+cache hits and roughly how much compile time it has saved.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class CompileCache:
+    """Thread-safe LRU of code objects keyed by a hash of the source"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def compile(self, code_str, filename="<string>"):
+        """Return the code object for the source; raises SyntaxError like compile()"""
+        key = hashlib.sha256(code_str.encode("utf-8", "surrogatepass")).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.seconds_saved += entry[1]
+                return entry[0]
+            self.misses += 1
+        started = time.perf_counter()
+        code = compile(code_str, filename, "exec")
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._entries[key] = (code, elapsed)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return code
+
+    def stats(self):
+        """Hit/miss counters and the compile time saved by hits"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "seconds_saved": self.seconds_saved,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,133 @@
+"""Benchmarks that check how a learner's function scales with input size.
+
+An exercise can declare a benchmark spec (a dict literal):
+
+    benchmark={
+        "args": "([random.randrange(2 * n) for _ in range(n)],)",
+        "max_exponent": 1.5,
+    }
+
+"args" is an expression in `n` (with `random` available, seeded) that
+builds the arguments for input size n. The function is timed at each of
+"sizes" (default BENCHMARK_SIZES) in a worker, and the growth exponent k of
+time ~ n**k is fitted on a log-log scale. A solution whose exponent is
+above "max_exponent" gets a warning, or fails if "enforce" is true.
+"""
+import math
+import threading
+from collections import namedtuple
+
+from executor import run_code
+from result_cache import cache_key
+
+BENCHMARK_SIZES = [1000, 2000, 4000, 8000, 16000, 32000]
+# Seconds a benchmark may spend before it stops moving to larger sizes
+BENCHMARK_BUDGET = 3.0
+# Each size is timed over enough calls to take at least this long
+BENCHMARK_MIN_TIME = 0.01
+# The exponent is fitted on this many of the largest sizes, where
+# constant overheads matter least
+FIT_POINTS = 4
+
+BENCHMARK_MARKER = "__benchmark__:"
+
+_BENCHMARK_TEMPLATE = """{code}
+
+def __benchmark():
+    import random
+    import time
+    random.seed(0)
+    started = time.perf_counter()
+    for n in {sizes!r}:
+        args = {args}
+        calls, elapsed = 0, 0.0
+        while elapsed < {min_time!r}:
+            batch = max(1, calls)
+            t0 = time.perf_counter()
+            for _ in range(batch):
+                {function_name}(*args)
+            elapsed += time.perf_counter() - t0
+            calls += batch
+        print({marker!r}, n, elapsed / calls)
+        if time.perf_counter() - started > {budget!r}:
+            break
+
+__benchmark()
+"""
+
+Timings = namedtuple("Timings", ["sizes", "seconds", "exponent"])
+ComplexityReport = namedtuple(
+    "ComplexityReport",
+    ["sizes", "seconds", "exponent", "reference_sizes", "reference_seconds",
+     "reference_exponent", "max_exponent", "within_bound"],
+)
+
+
+def benchmark_source(code_str, function_name, spec):
+    """Source that runs the code, then times the function at growing sizes"""
+    return _BENCHMARK_TEMPLATE.format(
+        code=code_str,
+        function_name=function_name,
+        sizes=list(spec.get("sizes", BENCHMARK_SIZES)),
+        args=spec["args"],
+        min_time=BENCHMARK_MIN_TIME,
+        budget=BENCHMARK_BUDGET,
+        marker=BENCHMARK_MARKER,
+    )
+
+
+def growth_exponent(sizes, seconds):
+    """Least-squares slope of log(time) against log(n), or None with fewer than 3 points"""
+    points = [(math.log(n), math.log(t)) for n, t in zip(sizes, seconds) if t > 0][-FIT_POINTS:]
+    if len(points) < 3:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def run_benchmark(code_str, function_name, spec, session_id=None):
+    """Time the function in a worker and fit its growth exponent"""
+    result = run_code(benchmark_source(code_str, function_name, spec), session_id=session_id)
+    sizes, seconds = [], []
+    # A run cut short by a limit still returns the sizes it finished
+    for line in result.output.splitlines():
+        if line.startswith(BENCHMARK_MARKER):
+            _, n, elapsed = line.split()
+            sizes.append(int(n))
+            seconds.append(float(elapsed))
+    return Timings(sizes, seconds, growth_exponent(sizes, seconds))
+
+
+_reference_timings = {}
+_reference_lock = threading.Lock()
+
+
+def reference_timings(solution_code, function_name, spec):
+    """Timings of the reference solution, measured once per server process"""
+    key = cache_key(solution_code, function_name, sorted(spec.items()))
+    with _reference_lock:
+        timings = _reference_timings.get(key)
+    if timings is None:
+        timings = run_benchmark(solution_code, function_name, spec)
+        with _reference_lock:
+            _reference_timings[key] = timings
+    return timings
+
+
+def check_complexity(code_str, solution_code, function_name, spec, session_id=None):
+    """Benchmark a submission next to the reference solution"""
+    reference = reference_timings(solution_code, function_name, spec)
+    timings = run_benchmark(code_str, function_name, spec, session_id)
+    max_exponent = spec["max_exponent"]
+    if timings.exponent is None:
+        # Too few sizes finished within the budget to fit a curve
+        within_bound = False
+    else:
+        within_bound = timings.exponent <= max_exponent
+    return ComplexityReport(
+        timings.sizes, timings.seconds, timings.exponent,
+        reference.sizes, reference.seconds, reference.exponent,
+        max_exponent, within_bound,
+    )
@@ -0,0 +1,114 @@
+"""Sample datasets shared by the lesson pages and learner code.
+
+Every dataset is registered under the variable name the lessons use for
+it, with a seed and a version. It is built the first time it is asked
+for and then kept for the life of the process, so reruns and other
+sessions get it without generating it again.
+
+The kept DataFrame is never handed out itself. The arrays of its blocks
+are read-only, and `get_dataset()` returns a shallow copy. Columns can be
+added to or replaced in the copy without affecting anyone else. Editing
+values in place (`.loc[0, "tip"] = 0`, `df["tip"] *= 2`) fails, unless
+pandas copies on write (the default from pandas 3), in which case the
+copy gets its own arrays first. Call `.copy()` or pass `deep=True` to
+edit on any version. Learner code run by the executor finds the datasets
+it mentions already defined, as deep copies of its own (see executor.py).
+
+Bump a dataset's version whenever its builder changes. The versions are
+part of the result cache key, so cached outputs of snippets that use it
+are not reused.
+"""
+import threading
+from collections import namedtuple
+
+DatasetSpec = namedtuple("DatasetSpec", ["name", "version", "seed", "build", "description"])
+
+# name -> DatasetSpec
+_registry = {}
+# name -> the built DataFrame, read-only
+_built = {}
+_lock = threading.Lock()
+
+
+def register(name, version, seed, description=""):
+    """Decorator registering `build(rng)` as the builder of a dataset
+
+    `rng` is a numpy RandomState seeded with `seed`, which draws the same
+    numbers as calling np.random functions after np.random.seed(seed).
+    """
+    def decorator(build):
+        _registry[name] = DatasetSpec(name, version, seed, build, description)
+        return build
+    return decorator
+
+
+def dataset_names():
+    return list(_registry)
+
+
+def fingerprint():
+    """Names and versions of all datasets, for cache keys"""
+    return ";".join(f"{spec.name}@{spec.version}" for spec in _registry.values())
+
+
+def _freeze(frame):
+    # Columns of one dtype share a block, and frame[column].values may be a
+    # view or copy of it, so the blocks themselves are made read-only
+    for block in frame._mgr.blocks:
+        values = getattr(block.values, "_ndarray", block.values)
+        if hasattr(values, "flags"):
+            values.flags.writeable = False
+    return frame
+
+
+def _shared(name):
+    frame = _built.get(name)
+    if frame is None:
+        with _lock:
+            frame = _built.get(name)
+            if frame is None:
+                import numpy as np
+                spec = _registry[name]
+                frame = _built[name] = _freeze(spec.build(np.random.RandomState(spec.seed)))
+    return frame
+
+
+def get_dataset(name, deep=False):
+    """Return a copy of a registered dataset; KeyError if there is none by that name
+
+    The copy shares its values with every other copy unless `deep` is true.
+    """
+    if name not in _registry:
+        raise KeyError(f"Unknown dataset: {name!r}")
+    return _shared(name).copy(deep=deep)
+
+
+@register("tips", version=1, seed=42, description="Restaurant bills and tips (200 rows)")
+def _tips(rng):
+    import pandas as pd
+    return pd.DataFrame({
+        'total_bill': rng.uniform(10, 50, 200),
+        'tip': rng.uniform(1, 10, 200),
+        'sex': rng.choice(['Male', 'Female'], 200),
+        'smoker': rng.choice(['Yes', 'No'], 200),
+        'day': rng.choice(['Sun', 'Sat', 'Fri', 'Thur'], 200),
+        'time': rng.choice(['Dinner', 'Lunch'], 200),
+        'size': rng.choice([1, 2, 3, 4, 5, 6], 200)
+    })
+
+
+@register("sales_df", version=1, seed=42, description="Daily product sales for 1000 days")
+def _sales(rng):
+    import numpy as np
+    import pandas as pd
+    n_samples = 1000
+    sales_df = pd.DataFrame({
+        'date': pd.date_range('20230101', periods=n_samples),
+        'product_id': rng.choice(['P001', 'P002', 'P003', 'P004', 'P005'], n_samples),
+        'category': rng.choice(['Electronics', 'Clothing', 'Books', 'Home', 'Food'], n_samples),
+        'quantity': rng.randint(1, 10, n_samples),
+        'price': np.round(rng.uniform(10, 100, n_samples), 2),
+        'customer_id': rng.choice(['C' + str(i).zfill(3) for i in range(1, 201)], n_samples)
+    })
+    sales_df['total_sales'] = sales_df['quantity'] * sales_df['price']
+    return sales_df
@@ -0,0 +1,894 @@
+"""Execution backends for learner code.
+
+`utils.execute_code` hands every snippet to the backend returned by
+`get_executor()`. Two backends are available:
+
+- "process" (default): a pool of pre-forked worker processes that already
+  have numpy, pandas, matplotlib, seaborn and scipy imported
+- "inline": plain exec() inside the Streamlit server process
+
+The backend and the pool size can be chosen with the EXECUTOR_BACKEND and
+EXECUTOR_WORKERS environment variables.
+
+Passing `on_output` to `run_code` streams output while the code is still
+running: workers send what was printed at most every STREAM_INTERVAL
+seconds, and the callback receives `(stream, text)` pieces.
+
+Workers render matplotlib figures themselves: `plt.show()` and any figure
+still open when the run ends are saved as PNG (or SVG) bytes in
+`ExecutionResult.figures` and closed, so no figure objects outlive a run.
+The inline backend shares pyplot with the server; it renders and closes
+the figures a run opened and left open (not those of other sessions), but
+plt.show() doesn't render on the spot.
+
+Code that reads a registered dataset (see dataset_registry.py), like `tips` or
+`sales_df`, without defining it first finds it in its namespace, as a
+copy it can change freely.
+
+Passing `seed` to `run_code` pins the random generators of the run: the
+`random` module, numpy's global generator and every numpy `default_rng()`
+start from that seed, and calls to reseed them are ignored. Graders use it
+so that solution and submission draw the same numbers whatever seed (if
+any) they set. The inline backend shares these generators with the server
+and ignores `seed`.
+
+Every run is bounded by an ExecutionLimits (wall time, CPU seconds, memory
+and output size). When a limit is hit the run is cancelled and the result
+carries the name of the limit in `limit_exceeded`. The inline backend can
+only enforce the output limit.
+"""
+import atexit
+import contextlib
+import contextvars
+import marshal
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict, deque, namedtuple
+from io import BytesIO, StringIO
+
+from compile_cache import CompileCache
+from dataset_registry import dataset_names, get_dataset
+from result_cache import ResultCache, cache_key, is_cacheable
+from scheduler import PRIORITY_NORMAL, QueueFull, Scheduler
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Libraries imported once per worker so that learner code doesn't pay for them
+PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "matplotlib",
+    "matplotlib.pyplot",
+    "seaborn",
+    "scipy",
+    "scipy.stats",
+]
+
+ExecutionResult = namedtuple(
+    "ExecutionResult",
+    ["output", "error", "exception", "limit_exceeded", "figures"],
+    defaults=(None, ()),
+)
+
+ExecutionLimits = namedtuple(
+    "ExecutionLimits",
+    ["wall_time", "cpu_time", "memory_mb", "output_kb"],
+)
+
+DEFAULT_LIMITS = ExecutionLimits(
+    wall_time=float(os.environ.get("EXECUTOR_WALL_TIME", 10)),
+    cpu_time=int(os.environ.get("EXECUTOR_CPU_TIME", 5)),
+    memory_mb=int(os.environ.get("EXECUTOR_MEMORY_MB", 512)),
+    output_kb=int(os.environ.get("EXECUTOR_OUTPUT_KB", 256)),
+)
+
+LIMIT_MESSAGES = {
+    "wall_time": "Time limit exceeded: your code ran for more than {wall_time:g} seconds.",
+    "cpu_time": "CPU limit exceeded: your code used more than {cpu_time} seconds of CPU time.",
+    "memory": "Memory limit exceeded: your code tried to use more than {memory_mb} MB.",
+    "output": "Output limit exceeded: your code printed more than {output_kb} KB.",
+    "queue": "The server is busy and you already have runs waiting. Please try again in a moment.",
+}
+
+WORKER_CRASHED_MESSAGE = "The execution worker crashed while running your code."
+
+# Seconds between output messages sent by a worker while a run is streaming
+STREAM_INTERVAL = 0.1
+STREAM_CHUNK_CHARS = 8192
+
+# How workers save figures: "png" or "svg"
+FIGURE_FORMAT = os.environ.get("EXECUTOR_FIGURE_FORMAT", "png")
+FIGURE_DPI = 100
+# Figures kept per run; further figures are closed without being rendered
+MAX_FIGURES = 10
+
+
+class LimitExceeded(BaseException):
+    """Raised inside a run to cancel it; not catchable with `except Exception`"""
+
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.limit = limit
+
+
+def limit_result(limit, limits, output="", error=""):
+    """Build the structured result returned for a cancelled run"""
+    message = LIMIT_MESSAGES[limit].format(**limits._asdict())
+    return ExecutionResult(output, error, message, limit)
+
+
+class _LimitedStringIO(StringIO):
+    """StringIO that cancels the run once more than `max_chars` are written"""
+
+    def __init__(self, max_chars, on_write=None):
+        super().__init__()
+        self._remaining = max_chars
+        self._on_write = on_write
+
+    def write(self, s):
+        if len(s) > self._remaining:
+            s = s[:self._remaining]
+            super().write(s)
+            self._remaining = 0
+            if self._on_write is not None:
+                self._on_write(s)
+            raise LimitExceeded("output")
+        self._remaining -= len(s)
+        if self._on_write is not None:
+            self._on_write(s)
+        return super().write(s)
+
+
+class OutputRingBuffer:
+    """Keeps only the last `max_chars` characters written to it"""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.dropped = 0
+        self._chunks = deque()
+        self._size = 0
+
+    def write(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+        while self._size > self.max_chars:
+            excess = self._size - self.max_chars
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                removed = len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                removed = excess
+            self._size -= removed
+            self.dropped += removed
+
+    def getvalue(self):
+        return "".join(self._chunks)
+
+
+class _OutputSender:
+    """Batches output printed in a worker and sends it to the parent"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._pending = []
+        self._pending_chars = 0
+        # Zero so that the first print of a run is sent right away
+        self._last_sent = 0.0
+
+    def writer(self, stream):
+        return lambda text: self.add(stream, text)
+
+    def add(self, stream, text):
+        self._pending.append((stream, text))
+        self._pending_chars += len(text)
+        # print() writes the text and the newline separately; send whole lines
+        if self._pending_chars >= STREAM_CHUNK_CHARS \
+                or ("\n" in text and time.monotonic() - self._last_sent >= STREAM_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._conn.send(("output", self._pending))
+            self._pending = []
+            self._pending_chars = 0
+        self._last_sent = time.monotonic()
+
+
+# Sinks for the run active in the current thread/context. sys.stdout and
+# sys.stderr are replaced once by routing proxies that write to these when set,
+# so concurrent sessions never see each other's output.
+_stdout_sink = contextvars.ContextVar("stdout_sink", default=None)
+_stderr_sink = contextvars.ContextVar("stderr_sink", default=None)
+_routing_lock = threading.Lock()
+
+
+class _RoutingStream:
+    """Stand-in for sys.stdout/sys.stderr that writes to the context-local sink"""
+
+    def __init__(self, default, sink_var):
+        self._default = default
+        self._sink_var = sink_var
+
+    def _target(self):
+        sink = self._sink_var.get()
+        return self._default if sink is None else sink
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        # encoding, fileno, isatty, ... come from the real stream
+        return getattr(self._default, name)
+
+
+def _install_routing():
+    """Put the routing proxies in place of sys.stdout and sys.stderr"""
+    with _routing_lock:
+        if not isinstance(sys.stdout, _RoutingStream):
+            sys.stdout = _RoutingStream(sys.stdout, _stdout_sink)
+        if not isinstance(sys.stderr, _RoutingStream):
+            sys.stderr = _RoutingStream(sys.stderr, _stderr_sink)
+
+
+@contextlib.contextmanager
+def capture_output(max_chars=None, sender=None):
+    """Capture stdout and stderr for code execution in the current context"""
+    _install_routing()
+    if max_chars is None:
+        new_stdout, new_stderr = StringIO(), StringIO()
+    elif sender is None:
+        new_stdout, new_stderr = _LimitedStringIO(max_chars), _LimitedStringIO(max_chars)
+    else:
+        new_stdout = _LimitedStringIO(max_chars, sender.writer("stdout"))
+        new_stderr = _LimitedStringIO(max_chars, sender.writer("stderr"))
+    stdout_token = _stdout_sink.set(new_stdout)
+    stderr_token = _stderr_sink.set(new_stderr)
+    try:
+        yield new_stdout, new_stderr
+    finally:
+        _stdout_sink.reset(stdout_token)
+        _stderr_sink.reset(stderr_token)
+
+
+def _new_namespace():
+    return {"__name__": "__main__", "__builtins__": __builtins__}
+
+
+def _dataset_names(code):
+    """Registered datasets a code object, or any function defined in it, reads as globals"""
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= _dataset_names(constant)
+    return names.intersection(dataset_names())
+
+
+def _add_datasets(code, namespace):
+    """Define the datasets the code uses and the namespace doesn't have yet, as private copies"""
+    for name in _dataset_names(code):
+        if name not in namespace:
+            namespace[name] = get_dataset(name, deep=True)
+
+
+def _run_source(code, limits, sender=None, namespace=None):
+    """Execute source or a code object and return an ExecutionResult
+
+    Code runs in `namespace` if given (kernel mode), otherwise in a fresh one.
+    """
+    if namespace is None:
+        namespace = _new_namespace()
+    with capture_output(limits.output_kb * 1024, sender) as (out, err):
+        try:
+            if isinstance(code, str):
+                code = compile(code, "<string>", "exec")
+            _add_datasets(code, namespace)
+            exec(code, namespace)
+            return ExecutionResult(out.getvalue(), err.getvalue(), None)
+        except LimitExceeded as e:
+            return limit_result(e.limit, limits, out.getvalue(), err.getvalue())
+        except MemoryError:
+            return limit_result("memory", limits, out.getvalue(), err.getvalue())
+        except Exception as e:
+            return ExecutionResult(out.getvalue(), err.getvalue(), str(e))
+        except (SystemExit, KeyboardInterrupt) as e:
+            # exit() or Ctrl-C in learner code ends the run, not the worker or the server
+            code = getattr(e, "code", None)
+            name = type(e).__name__
+            return ExecutionResult(out.getvalue(), err.getvalue(), f"{name}: {code}" if code is not None else name)
+
+
+def _soft_limit(value, hard):
+    """Clamp a soft rlimit to the hard one"""
+    if hard == resource.RLIM_INFINITY:
+        return value
+    return min(value, hard)
+
+
+def _address_space_bytes():
+    """Current virtual memory size of this process, or None if unknown"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+@contextlib.contextmanager
+def _resource_limits(limits, memory_baseline=None):
+    """Apply CPU and memory rlimits to the current process for one run
+
+    Memory is measured from `memory_baseline` if given, so that a kernel's
+    limit covers everything it has kept from earlier runs.
+    """
+    if resource is None:
+        yield
+        return
+    old_cpu = resource.getrlimit(resource.RLIMIT_CPU)
+    old_as = resource.getrlimit(resource.RLIMIT_AS)
+    # Workers are reused, so both limits are relative to what is already used
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_used = int(usage.ru_utime + usage.ru_stime) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (_soft_limit(cpu_used + limits.cpu_time, old_cpu[1]), old_cpu[1]))
+    baseline = memory_baseline or _address_space_bytes()
+    if baseline is not None:
+        memory = baseline + limits.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (_soft_limit(memory, old_as[1]), old_as[1]))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, old_cpu)
+        resource.setrlimit(resource.RLIMIT_AS, old_as)
+
+
+def _on_cpu_limit(signum, frame):
+    raise LimitExceeded("cpu_time")
+
+
+def _preload_modules():
+    """Import the heavy libraries learner code usually needs"""
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+    # Workers never open windows, so pin the non-interactive backend
+    if "matplotlib" in sys.modules:
+        sys.modules["matplotlib"].use("Agg")
+    if "matplotlib.pyplot" in sys.modules:
+        sys.modules["matplotlib.pyplot"].show = _show_figures
+
+
+# Figures rendered during the current run of this worker, as (format, bytes)
+_figures = []
+
+
+def _render_figures(figures=_figures, numbers=None):
+    """Save every open pyplot figure (or those numbered in `numbers`) into `figures` and close it"""
+    plt = sys.modules.get("matplotlib.pyplot")
+    if plt is None:
+        return
+    for number in plt.get_fignums():
+        if numbers is not None and number not in numbers:
+            continue
+        figure = plt.figure(number)
+        if len(figures) < MAX_FIGURES:
+            buffer = BytesIO()
+            try:
+                figure.savefig(buffer, format=FIGURE_FORMAT, dpi=FIGURE_DPI, bbox_inches="tight")
+            except Exception:
+                pass  # A figure that can't be drawn is left out
+            else:
+                figures.append((FIGURE_FORMAT, buffer.getvalue()))
+        plt.close(figure)
+
+
+def _show_figures(*args, **kwargs):
+    """Stand-in for plt.show() in workers: render the figures instead of opening windows"""
+    _render_figures()
+
+
+def _reset_plot_style():
+    """Undo style changes such as sns.set_theme() so they don't leak into the next run"""
+    if "matplotlib" in sys.modules:
+        sys.modules["matplotlib"].rcdefaults()
+
+
+def _collect_figures(result, limits):
+    """Attach the figures of the finished run to its result"""
+    try:
+        _render_figures()
+    except LimitExceeded as e:
+        result = limit_result(e.limit, limits, result.output, result.error)
+    except MemoryError:
+        result = limit_result("memory", limits, result.output, result.error)
+    finally:
+        plt = sys.modules.get("matplotlib.pyplot")
+        if plt is not None:
+            plt.close("all")
+    figures = tuple(_figures)
+    del _figures[:]
+    return result._replace(figures=figures)
+
+
+def _ignore_seed(*args, **kwargs):
+    """Stand-in for seeding functions while a run's random generators are pinned"""
+
+
+@contextlib.contextmanager
+def _pinned_random(seed):
+    """Seed random, numpy.random and default_rng() for one run and ignore reseeding"""
+    if seed is None:
+        yield
+        return
+    import random
+    np_random = sys.modules.get("numpy.random")
+    random_seed = random.seed
+    random_seed(seed)
+    random.seed = _ignore_seed
+    if np_random is not None:
+        numpy_seed, default_rng = np_random.seed, np_random.default_rng
+        numpy_seed(seed)
+        sequence = np_random.SeedSequence(seed)
+        np_random.seed = _ignore_seed
+        # Each generator gets its own stream, the same for the same order of calls
+        np_random.default_rng = lambda seed=None: default_rng(sequence.spawn(1)[0])
+    try:
+        yield
+    finally:
+        # The next run on this worker must not see predictable numbers
+        random.seed = random_seed
+        random_seed()
+        if np_random is not None:
+            np_random.seed, np_random.default_rng = numpy_seed, default_rng
+            numpy_seed()
+
+
+def _worker_main(conn, persistent=False):
+    """Main loop of a worker: receive code, send back results
+
+    A persistent worker (a kernel) keeps one namespace for all its runs.
+    """
+    _preload_modules()
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    namespace = _new_namespace() if persistent else None
+    memory_baseline = _address_space_bytes() if persistent else None
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        limits = request["limits"]
+        # Code objects arrive marshalled; the parent compiled them already
+        code = marshal.loads(request["code"])
+        sender = _OutputSender(conn) if request["stream"] else None
+        with _resource_limits(limits, memory_baseline):
+            with _pinned_random(request.get("seed")):
+                result = _run_source(code, limits, sender, namespace)
+            result = _collect_figures(result, limits)
+        if not persistent:
+            _reset_plot_style()
+        if sender is not None:
+            sender.flush()
+        conn.send(("result", result))
+
+
+# Numbers of the pyplot figures opened by the inline run active in this context
+_run_figure_numbers = contextvars.ContextVar("run_figure_numbers", default=None)
+_track_figures_lock = threading.Lock()
+_tracking_figures = False
+
+
+def _track_figures():
+    """Make pyplot record new figures in _run_figure_numbers (installed once per process)
+
+    pyplot is shared by every session of the server, so this is how an
+    inline run tells its own figures from those of other sessions and pages.
+    """
+    global _tracking_figures
+    with _track_figures_lock:
+        if _tracking_figures:
+            return
+        from matplotlib import _pylab_helpers
+        set_new_active_manager = _pylab_helpers.Gcf._set_new_active_manager.__func__
+
+        def tracking(cls, manager):
+            numbers = _run_figure_numbers.get()
+            if numbers is not None:
+                numbers.add(manager.num)
+            return set_new_active_manager(cls, manager)
+
+        # Every figure pyplot opens is adopted through this classmethod
+        _pylab_helpers.Gcf._set_new_active_manager = classmethod(tracking)
+        _tracking_figures = True
+
+
+class _InlineKernel:
+    """Kernel of the inline backend: just a namespace kept between runs"""
+
+    def __init__(self):
+        self.namespace = _new_namespace()
+        self.alive = True
+
+    def run(self, code, limits, on_output=None):
+        return _run_source(code, limits, namespace=self.namespace)
+
+    def kill(self):
+        self.alive = False
+        self.namespace.clear()
+
+
+class InlineBackend:
+    """Run code with exec() in the calling process"""
+
+    name = "inline"
+
+    def run(self, code, limits=None, on_output=None, seed=None):
+        # Output is only delivered at the end: the run blocks this thread anyway
+        _track_figures()
+        numbers = set()
+        token = _run_figure_numbers.set(numbers)
+        try:
+            result = _run_source(code, limits or DEFAULT_LIMITS)
+        finally:
+            _run_figure_numbers.reset(token)
+        # pyplot is shared with the server: render the figures this run opened, like a worker would
+        figures = []
+        _render_figures(figures, numbers)
+        return result._replace(figures=tuple(figures))
+
+    def start_worker(self, persistent=False):
+        return _InlineKernel()
+
+    def shutdown(self):
+        pass
+
+
+_start_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _neutral_main():
+    """Hide the running script from multiprocessing while a worker starts
+
+    Streamlit installs the page being run as sys.modules["__main__"], and
+    new processes would re-run that whole page while starting up.
+    """
+    with _start_lock:
+        main = sys.modules.get("__main__")
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+class _Worker:
+    """A worker process together with the parent end of its pipe"""
+
+    def __init__(self, ctx, persistent=False):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, persistent), daemon=True)
+        with _neutral_main():
+            self.process.start()
+        child_conn.close()
+        self.alive = True
+
+    def run(self, code, limits, on_output=None, seed=None):
+        """Run code on this worker; a worker that had to be killed is no longer alive"""
+        if isinstance(code, str):
+            code = compile(code, "<string>", "exec")
+        # What was streamed so far, returned if the run has to be killed
+        partial = {
+            "stdout": OutputRingBuffer(limits.output_kb * 1024),
+            "stderr": OutputRingBuffer(limits.output_kb * 1024),
+        }
+        try:
+            request = {
+                "code": marshal.dumps(code),
+                "limits": limits,
+                "stream": on_output is not None,
+                "seed": seed,
+            }
+            self.conn.send(request)
+            deadline = time.monotonic() + limits.wall_time
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.conn.poll(remaining):
+                    # Only a kill can stop code that is stuck in C or ignores signals
+                    self.kill()
+                    return limit_result(
+                        "wall_time", limits, partial["stdout"].getvalue(), partial["stderr"].getvalue()
+                    )
+                kind, payload = self.conn.recv()
+                if kind == "result":
+                    return payload
+                for stream, text in payload:
+                    partial[stream].write(text)
+                    on_output(stream, text)
+        except (EOFError, OSError):
+            # The worker died mid-run (os._exit, segfault, ...)
+            self.kill()
+            return ExecutionResult(partial["stdout"].getvalue(), partial["stderr"].getvalue(), WORKER_CRASHED_MESSAGE)
+        except BaseException:
+            # on_output raised (Streamlit stops a rerun script this way) while the worker
+            # is still running the code; it must not go back to the pool and answer the next run
+            self.kill()
+            raise
+
+    def kill(self):
+        self.alive = False
+        with contextlib.suppress(OSError):
+            self.conn.send(None)
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+
+class ProcessPoolBackend:
+    """Dispatch code to a pool of warm worker processes"""
+
+    name = "process"
+
+    def __init__(self, size=None):
+        self.size = size or os.cpu_count() or 1
+        self._ctx = _mp_context()
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(self.start_worker())
+
+    def start_worker(self, persistent=False):
+        return _Worker(self._ctx, persistent)
+
+    def run(self, code, limits=None, on_output=None, seed=None):
+        # Blocks until a worker is free, which naturally queues concurrent runs
+        worker = self._idle.get()
+        try:
+            return worker.run(code, limits or DEFAULT_LIMITS, on_output, seed)
+        finally:
+            # Replace a worker that crashed or was killed for running too long
+            self._idle.put(worker if worker.alive else self.start_worker())
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.kill()
+
+
+class KernelManager:
+    """Long-lived per-session workers that keep their namespace between runs
+
+    Kernels are started on a session's first kernel-mode run, stopped by
+    `reset()`, and evicted after `idle_timeout` seconds without a run or
+    when more than `max_kernels` exist (least recently used first, skipping
+    kernels in the middle of a run).
+    """
+
+    def __init__(self, backend, idle_timeout, max_kernels, memory_mb):
+        self.backend = backend
+        self.idle_timeout = idle_timeout
+        self.max_kernels = max_kernels
+        self.memory_mb = memory_mb
+        # session id -> [kernel, lock, last used]; ordered by last use
+        self._kernels = OrderedDict()
+        self._lock = threading.Lock()
+        reaper = threading.Thread(target=self._reap_forever, name="kernel-reaper", daemon=True)
+        reaper.start()
+
+    def _checkout(self, session_id):
+        with self._lock:
+            entry = self._kernels.get(session_id)
+            if entry is None or not entry[0].alive:
+                entry = [self.backend.start_worker(persistent=True), threading.Lock(), time.monotonic()]
+                self._kernels[session_id] = entry
+            self._kernels.move_to_end(session_id)
+            evicted = self._over_capacity()
+        for kernel in evicted:
+            kernel.kill()
+        return entry
+
+    def _over_capacity(self):
+        # Kernels in the middle of a run are skipped, as in reap(); their owner would see a crash
+        excess = len(self._kernels) - self.max_kernels
+        idle = [session_id for session_id, (_, lock, _) in self._kernels.items() if not lock.locked()]
+        return [self._kernels.pop(session_id)[0] for session_id in idle[:max(excess, 0)]]
+
+    def run(self, session_id, code, limits, on_output=None):
+        """Run code in the session's kernel, starting one if needed"""
+        kernel, lock, _ = entry = self._checkout(session_id)
+        # The kernel's memory cap covers everything it keeps between runs
+        limits = limits._replace(memory_mb=self.memory_mb)
+        with lock:
+            result = kernel.run(code, limits, on_output)
+            entry[2] = time.monotonic()
+        if not kernel.alive:
+            # Killed for a limit or crashed: the next run starts from scratch
+            result = result._replace(exception=f"{result.exception} Your variables have been reset.")
+        return result
+
+    def reset(self, session_id):
+        """Stop the session's kernel, discarding its variables"""
+        with self._lock:
+            entry = self._kernels.pop(session_id, None)
+        if entry is not None:
+            entry[0].kill()
+
+    def active(self, session_id):
+        with self._lock:
+            entry = self._kernels.get(session_id)
+            return entry is not None and entry[0].alive
+
+    def reap(self):
+        """Stop kernels that have been idle for longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [
+                session_id for session_id, (_, lock, last_used) in self._kernels.items()
+                if last_used < cutoff and not lock.locked()
+            ]
+            evicted = [self._kernels.pop(session_id)[0] for session_id in idle]
+        for kernel in evicted:
+            kernel.kill()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 30))
+            self.reap()
+
+    def shutdown(self):
+        with self._lock:
+            kernels = [entry[0] for entry in self._kernels.values()]
+            self._kernels.clear()
+        for kernel in kernels:
+            kernel.kill()
+
+
+def _mp_context():
+    """Pick a start method that is safe inside a multi-threaded server"""
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        ctx = multiprocessing.get_context("forkserver")
+        # The fork server imports these once, so each new worker starts warm
+        ctx.set_forkserver_preload(PRELOAD_MODULES)
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+_executor = None
+_scheduler = None
+_kernels = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide execution backend, creating it on first use"""
+    global _executor, _scheduler, _kernels
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                backend = os.environ.get("EXECUTOR_BACKEND", "process").lower()
+                if backend == "inline":
+                    _executor = InlineBackend()
+                else:
+                    workers = os.environ.get("EXECUTOR_WORKERS")
+                    _executor = ProcessPoolBackend(int(workers) if workers else None)
+                atexit.register(_executor.shutdown)
+                slots = getattr(_executor, "size", None) or os.cpu_count() or 1
+                _scheduler = Scheduler(
+                    slots,
+                    per_session=int(os.environ.get("EXECUTOR_RUNS_PER_SESSION", 1)),
+                    max_queued=int(os.environ.get("EXECUTOR_QUEUED_PER_SESSION", 3)),
+                )
+                _kernels = KernelManager(
+                    _executor,
+                    idle_timeout=float(os.environ.get("KERNEL_IDLE_TIMEOUT", 600)),
+                    max_kernels=int(os.environ.get("KERNEL_MAX", 4 * slots)),
+                    memory_mb=int(os.environ.get("KERNEL_MEMORY_MB", 1024)),
+                )
+                atexit.register(_kernels.shutdown)
+    return _executor
+
+
+def get_kernels():
+    """Return the manager of per-session kernels"""
+    get_executor()
+    return _kernels
+
+
+def get_scheduler():
+    """Return the scheduler that hands out execution slots"""
+    get_executor()
+    return _scheduler
+
+
+def scheduler_metrics():
+    """Queue depth and wait-time metrics of the execution scheduler"""
+    return get_scheduler().metrics()
+
+
+def _scheduled_run(code, limits, on_output, session_id, priority, on_queue, kernel=False, seed=None,
+                   session_limits=None):
+    """Run code on the backend (or the session's kernel) once the scheduler grants a slot"""
+    backend = get_executor()
+    # Internal callers (precompute, tools) are not subject to per-session limits
+    session = session_id if session_id is not None else object()
+    try:
+        with get_scheduler().slot(session, priority, on_queue, *(session_limits or ())):
+            if kernel:
+                return get_kernels().run(session_id, code, limits, on_output)
+            return backend.run(code, limits, on_output, seed)
+    except QueueFull:
+        return limit_result("queue", limits)
+
+
+# Shared by all sessions of this server process
+result_cache = ResultCache(int(os.environ.get("EXECUTOR_CACHE_MB", 64)) * 1024 * 1024)
+compile_cache = CompileCache(int(os.environ.get("EXECUTOR_COMPILE_CACHE_SIZE", 512)))
+
+
+def run_code(code_str, limits=None, use_cache=True, on_output=None,
+             session_id=None, priority=PRIORITY_NORMAL, on_queue=None, kernel=False, seed=None,
+             session_limits=None):
+    """Execute code on the configured backend and return an ExecutionResult
+
+    Runs that miss the caches wait for a slot from the scheduler;
+    `on_queue(position)` is called while they are waiting. With `kernel=True`
+    the code runs in the session's kernel and sees variables from its
+    earlier kernel runs. `seed` pins the run's random number generators.
+    `session_limits`, a (per_session, max_queued) pair, replaces the
+    scheduler's limits for `session_id`.
+    """
+    limits = limits or DEFAULT_LIMITS
+    try:
+        code = compile_cache.compile(code_str)
+    except (SyntaxError, ValueError) as e:
+        # Nothing to execute: report the failing line without using a worker
+        return ExecutionResult("", "", str(e))
+    if kernel:
+        if session_id is None:
+            raise ValueError("kernel mode needs a session_id")
+        # Kernel output depends on earlier runs, so it is never cached
+        return _scheduled_run(code, limits, on_output, session_id, priority, on_queue, kernel=True)
+    if not (use_cache and is_cacheable(code_str, random_pinned=seed is not None)):
+        return _scheduled_run(code, limits, on_output, session_id, priority, on_queue, seed=seed,
+                              session_limits=session_limits)
+    key = cache_key(code_str, limits, seed)
+    result = result_cache.get(key)
+    if result is None:
+        result = _scheduled_run(code, limits, on_output, session_id, priority, on_queue, seed=seed,
+                                session_limits=session_limits)
+        # Limit hits and crashes depend on server load, not on the code
+        if result.limit_exceeded is None and result.exception != WORKER_CRASHED_MESSAGE:
+            result_cache.put(key, result)
+    return result
@@ -0,0 +1,422 @@
+"""Exercise definitions and grading helpers shared by the pages and tools.
+
+Exercises are declared in `pages/*.py` through `utils.create_exercise`.
+`discover_exercises` finds them statically, without running the pages, so
+reference outputs can be precomputed in a build step:
+
+    python grading.py precompute
+
+Reference outputs are stored in expected_outputs.json under a hash of the
+solution source (and the library versions), so an edited solution is
+recomputed automatically the next time it is needed. Solutions and
+submissions both run with their random generators pinned to GRADING_SEED,
+so code that draws random numbers is graded (and cached) reproducibly,
+whatever seed it sets itself.
+
+Exercises that name a `function_name` and list `test_cases` (tuples of
+literal arguments) are graded by `grade_cases`: every case calls the
+learner's function in its own worker run, several cases run in parallel,
+and grading stops at the first failing case.
+
+`grade_submission` grades either way and reuses the verdict of any earlier
+submission with the same logic (see verdict_cache.py). Submissions that
+miss one of the exercise's `requires` (see static_checks.py) are rejected
+without being run. Exercises with a `benchmark` spec also time correct
+submissions at growing input sizes (see complexity.py).
+"""
+import ast
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from complexity import ComplexityReport, check_complexity
+from executor import WORKER_CRASHED_MESSAGE, compile_cache, run_code
+from output_compare import compare_output, compare_reprs, format_mismatch
+from result_cache import cache_key, is_cacheable
+from static_checks import check_requirements
+from verdict_cache import VerdictCache, verdict_key
+
+PAGES_DIR = Path(__file__).resolve().parent / "pages"
+EXPECTED_OUTPUTS_PATH = Path(os.environ.get("EXPECTED_OUTPUTS_PATH", "expected_outputs.json"))
+
+# Test cases of one check that may run at the same time
+GRADING_PARALLEL_CASES = int(os.environ.get("GRADING_PARALLEL_CASES", 4))
+# Case runs a session may have executing across all its checks, including
+# cases of earlier checks that stopped early and are still finishing
+GRADING_RUNS_PER_SESSION = int(os.environ.get("GRADING_RUNS_PER_SESSION", GRADING_PARALLEL_CASES))
+# No new cases are started once a check has been running this many seconds
+GRADING_TIME_BUDGET = float(os.environ.get("GRADING_TIME_BUDGET", 20))
+# Solutions and submissions run with their random generators pinned to this seed
+GRADING_SEED = int(os.environ.get("GRADING_SEED", 42))
+
+# Printed before the return value of the function under test
+CASE_RESULT_MARKER = "__case_result__:"
+
+Exercise = namedtuple(
+    "Exercise",
+    ["page", "prompt", "solution_code", "function_name", "test_cases", "requires", "benchmark"],
+    defaults=(None, (), (), None),
+)
+ExpectedOutput = namedtuple("ExpectedOutput", ["output", "error", "exception"])
+CaseResult = namedtuple(
+    "CaseResult",
+    ["index", "args", "passed", "expected", "actual", "output", "exception", "seconds", "limit_exceeded", "diff"],
+)
+GradeReport = namedtuple("GradeReport", ["passed", "cases", "skipped", "message"])
+# `report` is set for test case grading; `figures` are never cached;
+# `problems` lists the unmet requirements of a submission that wasn't run;
+# `diff` describes the first difference from the expected output;
+# `complexity` holds the benchmark of exercises that declare one
+Verdict = namedtuple(
+    "Verdict",
+    ["passed", "output", "error", "exception", "report", "figures", "problems", "diff", "complexity"],
+    defaults=(None, (), (), None, None),
+)
+
+
+def exercise_id(prompt):
+    """Short stable id of an exercise, derived from its prompt"""
+    return hashlib.md5(prompt.encode()).hexdigest()[:8]
+
+
+def exercise_hash(prompt, solution_code, function_name=None, test_cases=(), requires=(),
+                  benchmark=None, test_func=None):
+    """Hash of everything that defines an exercise; it changes when the exercise is edited"""
+    definition = (
+        prompt,
+        solution_code,
+        function_name,
+        tuple(tuple(args) for args in test_cases),
+        tuple(requires),
+        sorted(benchmark.items()) if benchmark else None,
+        getattr(test_func, "__qualname__", None),
+    )
+    return hashlib.sha256(repr(definition).encode()).hexdigest()
+
+
+def _string_assignments(tree):
+    """Map variable names to the string literals assigned to them"""
+    strings = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) \
+                and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    strings[target.id] = node.value.value
+    return strings
+
+
+def _call_argument(call, position, keyword, strings):
+    """Resolve a create_exercise argument that is a literal or a named literal"""
+    if len(call.args) > position:
+        node = call.args[position]
+    else:
+        node = next((kw.value for kw in call.keywords if kw.arg == keyword), None)
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return strings.get(node.id)
+    return None
+
+
+def _literal_argument(call, keyword, default):
+    """Evaluate a keyword argument written as a Python literal"""
+    node = next((kw.value for kw in call.keywords if kw.arg == keyword), None)
+    if node is None:
+        return default
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return default
+
+
+def discover_exercises(pages_dir=PAGES_DIR):
+    """Find every create_exercise(...) call in the lesson pages"""
+    exercises = []
+    for page in sorted(Path(pages_dir).glob("*.py")):
+        tree = ast.parse(page.read_text(encoding="utf-8"), filename=str(page))
+        strings = _string_assignments(tree)
+        for node in ast.walk(tree):
+            if not (isinstance(node, ast.Call) and getattr(node.func, "id", None) == "create_exercise"):
+                continue
+            prompt = _call_argument(node, 0, "exercise_prompt", strings)
+            solution = _call_argument(node, 1, "solution_code", strings)
+            if prompt is not None and solution is not None:
+                function_name = _literal_argument(node, "function_name", None)
+                test_cases = tuple(_literal_argument(node, "test_cases", ()))
+                requires = tuple(_literal_argument(node, "requires", ()))
+                benchmark = _literal_argument(node, "benchmark", None)
+                exercises.append(Exercise(
+                    page.name, prompt, solution, function_name, test_cases, requires, benchmark,
+                ))
+    return exercises
+
+
+class ExpectedOutputStore:
+    """Reference outputs of exercise solutions, persisted as JSON"""
+
+    def __init__(self, path=EXPECTED_OUTPUTS_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._outputs = None
+
+    def _load(self):
+        if self._outputs is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._outputs = json.load(f).get("outputs", {})
+            except (OSError, ValueError):
+                self._outputs = {}
+        return self._outputs
+
+    def _save(self):
+        # Write to a temp file and rename it so readers never see a partial file
+        directory = self.path.parent
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=self.path.name, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"outputs": self._outputs}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, solution_code):
+        """Return the solution's ExpectedOutput, running it only if it is new
+
+        Solutions whose output can change between runs (clock, files, ...)
+        are run every time instead of being stored.
+        """
+        stored = is_cacheable(solution_code, random_pinned=True)
+        key = cache_key(solution_code, GRADING_SEED)
+        with self._lock:
+            entry = self._load().get(key) if stored else None
+        if entry is None:
+            result = run_code(solution_code, seed=GRADING_SEED)
+            if not stored or result.limit_exceeded is not None or result.exception == WORKER_CRASHED_MESSAGE:
+                # Don't persist a reference output that depends on when or where it ran
+                return ExpectedOutput(result.output, result.error, result.exception)
+            entry = {"output": result.output, "error": result.error, "exception": result.exception}
+            with self._lock:
+                self._load()[key] = entry
+                self._save()
+        return ExpectedOutput(entry["output"], entry["error"], entry["exception"])
+
+    def precompute(self, exercises):
+        """Make sure every exercise has an output and drop stale entries"""
+        keys = set()
+        for exercise in exercises:
+            sources = [exercise.solution_code]
+            sources.extend(
+                case_source(exercise.solution_code, exercise.function_name, args)
+                for args in exercise.test_cases
+            )
+            for source in sources:
+                if is_cacheable(source, random_pinned=True):
+                    self.get(source)
+                    keys.add(cache_key(source, GRADING_SEED))
+        with self._lock:
+            outputs = self._load()
+            for key in set(outputs) - keys:
+                del outputs[key]
+            self._save()
+        return len(exercises)
+
+
+expected_outputs = ExpectedOutputStore()
+
+
+def case_source(code_str, function_name, args):
+    """Source that runs the code, then prints the function's return value for one case"""
+    return f"{code_str}\n\nprint({CASE_RESULT_MARKER!r} + repr({function_name}(*{tuple(args)!r})))\n"
+
+
+def split_case_output(output):
+    """Split a case run's output into what the code printed and the returned value's repr"""
+    head, marker, value = output.rpartition(CASE_RESULT_MARKER)
+    if not marker:
+        return output, None
+    return head, value.rstrip("\n")
+
+
+def _run_case(index, code_str, solution_code, function_name, args, session_id):
+    expected = expected_outputs.get(case_source(solution_code, function_name, args))
+    _, expected_value = split_case_output(expected.output)
+    started = time.perf_counter()
+    # Twice the cap may wait, so a new check's cases can queue behind an earlier check's
+    session_limits = (GRADING_RUNS_PER_SESSION, 2 * GRADING_RUNS_PER_SESSION) if session_id is not None else None
+    result = run_code(case_source(code_str, function_name, args), session_id=session_id, seed=GRADING_SEED,
+                      session_limits=session_limits)
+    seconds = time.perf_counter() - started
+    output, actual_value = split_case_output(result.output)
+    diff = None
+    if result.exception is None and expected.exception is None:
+        diff = compare_reprs(actual_value, expected_value)
+    passed = result.exception is None and expected.exception is None and diff is None
+    return CaseResult(
+        index, tuple(args), passed, expected_value, actual_value, output,
+        result.exception, seconds, result.limit_exceeded, diff,
+    )
+
+
+def grade_cases(code_str, solution_code, function_name, test_cases, session_id=None,
+                parallel=GRADING_PARALLEL_CASES, time_budget=GRADING_TIME_BUDGET):
+    """Run the learner's function against every test case and return a GradeReport
+
+    Cases run `parallel` at a time and the check stops at the first failure
+    or once `time_budget` seconds have passed, so its cost stays bounded.
+    """
+    test_cases = list(test_cases)
+    try:
+        compile_cache.compile(code_str)
+    except (SyntaxError, ValueError) as e:
+        return GradeReport(False, [], len(test_cases), f"Your code has a syntax error: {e}")
+    # All case runs of a session share one scheduler session with its own cap
+    grading_session = (session_id, "grading") if session_id is not None else None
+    results = []
+    message = None
+    started = time.monotonic()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="grading")
+    try:
+        pending = {}
+        next_index = 0
+        while next_index < len(test_cases) or pending:
+            while next_index < len(test_cases) and len(pending) < parallel:
+                if time.monotonic() - started > time_budget:
+                    message = f"Grading stopped after {time_budget:g} seconds."
+                    break
+                future = pool.submit(
+                    _run_case, next_index, code_str, solution_code, function_name,
+                    test_cases[next_index], grading_session,
+                )
+                pending[future] = next_index
+                next_index += 1
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                results.append(future.result())
+            if any(not case.passed for case in results):
+                break
+    finally:
+        # Runs already started finish in the background; their results are not needed
+        pool.shutdown(wait=False, cancel_futures=True)
+    results.sort(key=lambda case: case.index)
+    passed = len(results) == len(test_cases) and all(case.passed for case in results)
+    return GradeReport(passed, results, len(test_cases) - len(results), message)
+
+
+verdicts = VerdictCache()
+
+
+def _verdict_to_dict(verdict):
+    # The page never shows the output of a check, so it isn't stored
+    data = {"passed": verdict.passed, "output": "", "error": verdict.error,
+            "exception": verdict.exception, "report": None, "diff": verdict.diff,
+            "complexity": verdict.complexity._asdict() if verdict.complexity else None}
+    if verdict.report is not None:
+        cases = [dict(case._asdict(), args=repr(case.args)) for case in verdict.report.cases]
+        data["report"] = dict(verdict.report._asdict(), cases=cases)
+    return data
+
+
+def _verdict_from_dict(data):
+    report = data["report"]
+    if report is not None:
+        cases = [CaseResult(**dict(case, args=ast.literal_eval(case["args"]))) for case in report["cases"]]
+        report = GradeReport(**dict(report, cases=cases))
+    complexity = ComplexityReport(**data["complexity"]) if data["complexity"] else None
+    return Verdict(
+        data["passed"], data["output"], data["error"], data["exception"], report,
+        diff=data["diff"], complexity=complexity,
+    )
+
+
+def exercise_requirements(function_name=None, requires=()):
+    """Structural requirements of an exercise, including defining the function under test"""
+    requirements = list(requires)
+    if function_name is not None:
+        requirements.insert(0, f"def {function_name}")
+    return requirements
+
+
+def grade_submission(code_str, solution_code, function_name=None, test_cases=(),
+                     session_id=None, on_queue=None, requires=(), benchmark=None):
+    """Grade a submission, reusing the verdict of earlier code with the same logic"""
+    problems = check_requirements(code_str, exercise_requirements(function_name, requires))
+    if problems:
+        return Verdict(False, "", "", None, problems=problems)
+    test_cases = tuple(tuple(args) for args in test_cases)
+    # Code whose output can change between runs has to be run every time
+    key = None
+    if is_cacheable(code_str, random_pinned=True):
+        benchmark_key = sorted(benchmark.items()) if benchmark else None
+        key = verdict_key(code_str, solution_code, function_name, test_cases, benchmark_key, GRADING_SEED)
+    if key is not None:
+        cached = verdicts.get(key)
+        if cached is not None:
+            return _verdict_from_dict(cached)
+    if test_cases:
+        report = grade_cases(code_str, solution_code, function_name, test_cases, session_id)
+        verdict = Verdict(report.passed, "", "", None, report)
+        # Limit hits and crashes depend on server load, not on the code
+        reusable = report.message is None and not any(
+            case.limit_exceeded or case.exception == WORKER_CRASHED_MESSAGE for case in report.cases
+        )
+    else:
+        result = run_code(code_str, session_id=session_id, on_queue=on_queue, seed=GRADING_SEED)
+        expected = expected_outputs.get(solution_code)
+        mismatch = None
+        if not (result.exception or result.error):
+            mismatch = compare_output(result.output, expected.output)
+        passed = not (result.exception or result.error) and mismatch is None
+        verdict = Verdict(
+            passed, result.output, result.error, result.exception, None, result.figures,
+            diff=format_mismatch(mismatch) if mismatch else None,
+        )
+        reusable = result.limit_exceeded is None and result.exception != WORKER_CRASHED_MESSAGE
+    if verdict.passed and benchmark:
+        complexity = check_complexity(code_str, solution_code, function_name, benchmark, session_id)
+        passed = complexity.within_bound or not benchmark.get("enforce", False)
+        verdict = verdict._replace(passed=passed, complexity=complexity)
+        # A slow measurement may be noise, so only good scaling is remembered
+        reusable = reusable and complexity.within_bound
+    if key is not None and reusable:
+        verdicts.put(key, _verdict_to_dict(verdict))
+    return verdict
+
+
+_precompute_started = False
+_precompute_lock = threading.Lock()
+
+
+def start_precompute():
+    """Fill the expected output store in the background, once per process"""
+    global _precompute_started
+    with _precompute_lock:
+        if _precompute_started:
+            return
+        _precompute_started = True
+    thread = threading.Thread(
+        target=lambda: expected_outputs.precompute(discover_exercises()),
+        name="precompute-expected-outputs",
+        daemon=True,
+    )
+    thread.start()
+
+
+def main(argv):
+    if argv[1:] != ["precompute"]:
+        print("usage: python grading.py precompute")
+        return 2
+    count = expected_outputs.precompute(discover_exercises())
+    print(f"Stored expected outputs for {count} exercises in {expected_outputs.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,180 @@
+"""Tolerant comparison of program output and return values for grading.
+
+Output is compared line by line, ignoring blank lines and differences in
+spacing. Within a line, numbers match if they are close (so 78.5 matches
+78.50000000000001), except that two integers must be equal, and lines
+holding a dict, list, tuple or set literal are compared as values, so
+dict and set ordering doesn't matter. Both sides are read lazily, line by
+line, and the comparison stops at the first mismatch, which is described
+by a short diff.
+"""
+import ast
+import io
+import math
+import re
+from collections import namedtuple
+from itertools import zip_longest
+
+REL_TOL = 1e-6
+ABS_TOL = 1e-9
+
+_TOKEN = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?|[^\W\d]\w*|\S")
+_NUMBER_START = set("+-.0123456789")
+_LITERAL_START = set("{[(")
+
+Mismatch = namedtuple("Mismatch", ["line", "expected", "actual", "detail"])
+
+
+def _content_lines(output):
+    """Yield (line number, stripped line) for the non-blank lines of a string or iterable of lines"""
+    lines = io.StringIO(output) if isinstance(output, str) else output
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line:
+            yield number, line
+
+
+def _as_number(token):
+    if token[0] not in _NUMBER_START:
+        return None
+    try:
+        return int(token)
+    except ValueError:
+        pass
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def _numbers_close(actual, expected, rel_tol, abs_tol):
+    """Integers must be equal; the tolerance only applies when either number is a float"""
+    if not (isinstance(actual, float) or isinstance(expected, float)):
+        return actual == expected
+    try:
+        actual, expected = float(actual), float(expected)
+    except OverflowError:
+        return False  # An integer too large to be a float is not close to any float
+    if math.isnan(actual) and math.isnan(expected):
+        return True
+    return math.isclose(actual, expected, rel_tol=rel_tol, abs_tol=abs_tol)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def compare_values(actual, expected, rel_tol=REL_TOL, abs_tol=ABS_TOL, path="value"):
+    """Describe the first difference between two values, or return None if they match"""
+    if _is_number(actual) and _is_number(expected):
+        if _numbers_close(actual, expected, rel_tol, abs_tol):
+            return None
+        return f"{path}: expected {expected!r}, got {actual!r}"
+    if type(actual) is not type(expected):
+        return f"{path}: expected {type(expected).__name__}, got {type(actual).__name__}"
+    if isinstance(expected, dict):
+        for key in expected:
+            if key not in actual:
+                return f"{path}: missing key {key!r}"
+        for key in actual:
+            if key not in expected:
+                return f"{path}: unexpected key {key!r}"
+        for key in expected:
+            difference = compare_values(actual[key], expected[key], rel_tol, abs_tol, f"{path}[{key!r}]")
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, (list, tuple)):
+        if len(actual) != len(expected):
+            return f"{path}: expected {len(expected)} items, got {len(actual)}"
+        for index, (a, e) in enumerate(zip(actual, expected)):
+            difference = compare_values(a, e, rel_tol, abs_tol, f"{path}[{index}]")
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, (set, frozenset)):
+        missing = expected - actual
+        if missing:
+            return f"{path}: missing {sorted(missing, key=repr)[0]!r}"
+        extra = actual - expected
+        if extra:
+            return f"{path}: unexpected {sorted(extra, key=repr)[0]!r}"
+        return None
+    if actual == expected:
+        return None
+    return f"{path}: expected {expected!r}, got {actual!r}"
+
+
+def _literal(text):
+    try:
+        return True, ast.literal_eval(text)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return False, None
+
+
+def _compare_line(actual, expected, rel_tol, abs_tol):
+    """Describe how two stripped lines differ, or return None if they match"""
+    if actual == expected:
+        return None
+    if actual[0] in _LITERAL_START and expected[0] in _LITERAL_START:
+        actual_ok, actual_value = _literal(actual)
+        expected_ok, expected_value = _literal(expected)
+        if actual_ok and expected_ok:
+            return compare_values(actual_value, expected_value, rel_tol, abs_tol)
+    actual_tokens = _TOKEN.findall(actual)
+    expected_tokens = _TOKEN.findall(expected)
+    for a, e in zip_longest(actual_tokens, expected_tokens):
+        if a == e:
+            continue
+        if a is None:
+            return f"expected `{e}` next, but the line ends"
+        if e is None:
+            return f"unexpected `{a}` at the end of the line"
+        a_number, e_number = _as_number(a), _as_number(e)
+        if a_number is not None and e_number is not None \
+                and _numbers_close(a_number, e_number, rel_tol, abs_tol):
+            continue
+        return f"expected `{e}`, got `{a}`"
+    return None
+
+
+def compare_output(actual, expected, rel_tol=REL_TOL, abs_tol=ABS_TOL):
+    """Return the first Mismatch between two outputs, or None if they match
+
+    Both outputs may be strings or iterables of lines.
+    """
+    actual_lines = _content_lines(actual)
+    expected_lines = _content_lines(expected)
+    for a, e in zip_longest(actual_lines, expected_lines):
+        if a is None:
+            return Mismatch(e[0], e[1], None, "your output ends here")
+        if e is None:
+            return Mismatch(a[0], None, a[1], "unexpected extra output")
+        detail = _compare_line(a[1], e[1], rel_tol, abs_tol)
+        if detail:
+            return Mismatch(a[0], e[1], a[1], detail)
+    return None
+
+
+def compare_reprs(actual, expected, rel_tol=REL_TOL, abs_tol=ABS_TOL):
+    """Compare two reprs of return values; returns a description of the difference or None"""
+    if actual == expected:
+        return None
+    if actual is None or expected is None:
+        return "no value was returned"
+    actual_ok, actual_value = _literal(actual)
+    expected_ok, expected_value = _literal(expected)
+    if actual_ok and expected_ok:
+        return compare_values(actual_value, expected_value, rel_tol, abs_tol)
+    mismatch = compare_output(actual, expected, rel_tol, abs_tol)
+    return mismatch.detail if mismatch else None
+
+
+def format_mismatch(mismatch):
+    """Short diff of a Mismatch for display"""
+    lines = [f"Line {mismatch.line}: {mismatch.detail}"]
+    if mismatch.expected is not None:
+        lines.append(f"- expected: {mismatch.expected}")
+    if mismatch.actual is not None:
+        lines.append(f"+ got:      {mismatch.actual}")
+    return "\n".join(lines)
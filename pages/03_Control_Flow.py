@@ -201,7 +201,8 @@ if number > 0:
 elif number < 0:
     print("The number is negative.")
 else:
-    print("The number is zero.")"""
+    print("The number is zero.")""",
+        requires=["if"],
     )
     
     # Second exercise (only shown if first one passes)
@@ -211,7 +212,8 @@ else:
             """for i in range(1, 11):
     if i % 2 != 0:  # If i is odd
         continue
-    print(i)"""
+    print(i)""",
+            requires=["for", "continue"],
         )
     else:
         exercise2_passed = False
@@ -204,7 +204,9 @@ print(sorted_points)  # Sorts by the second value in each tuple
     return 3.14 * radius ** 2
 
 area = calculate_area(5)
-print(area)"""
+print(area)""",
+        function_name="calculate_area",
+        test_cases=[(5,), (0,), (1,), (2.5,), (10,)],
     )
     
     # Second exercise (only shown if first one passes)
@@ -217,7 +219,9 @@ print(area)"""
     return text == text[::-1]
 
 result = is_palindrome("radar")
-print(result)"""
+print(result)""",
+            function_name="is_palindrome",
+            test_cases=[("radar",), ("hello",), ("level",), ("",), ("ab",), ("abca",)],
         )
     else:
         exercise2_passed = False
@@ -328,7 +328,13 @@ print(books[1]["title"])"""
 
 numbers = [10, 5, 2, 7, 8, 2, 10, 12, 3]
 result = get_unique_even_numbers(numbers)
-print(result)"""
+print(result)""",
+            function_name="get_unique_even_numbers",
+            test_cases=[([10, 5, 2, 7, 8, 2, 10, 12, 3],), ([],), ([1, 3, 5],), ([-4, 4, 0, -4],)],
+            benchmark={
+                "args": "([random.randrange(2 * n) for _ in range(n)],)",
+                "max_exponent": 1.5,
+            },
         )
     else:
         exercise2_passed = False
@@ -354,7 +354,10 @@ print(simulate_process_file("unexpected"))
 # Test cases
 print(safe_division(10, 2))  # Should return 5.0
 print(safe_division(10, 0))  # Should handle zero division
-print(safe_division("10", 2))  # Should handle type error"""
+print(safe_division("10", 2))  # Should handle type error""",
+        function_name="safe_division",
+        requires=["try", "except ZeroDivisionError", "except TypeError"],
+        test_cases=[(10, 2), (10, 0), ("10", 2), (-9, 3), (1, 4)],
     )
     
     # Second exercise (only shown if first one passes)
@@ -371,7 +374,15 @@ print(safe_division("10", 2))  # Should handle type error"""
 person = {"name": "Alice", "age": 30}
 print(get_dict_value(person, "name"))  # Should return "Alice"
 print(get_dict_value(person, "address"))  # Should return None
-print(get_dict_value(person, "address", "Unknown"))  # Should return "Unknown"""
+print(get_dict_value(person, "address", "Unknown"))  # Should return "Unknown""",
+            function_name="get_dict_value",
+            requires=["try", "except KeyError"],
+            test_cases=[
+                ({"name": "Alice", "age": 30}, "name"),
+                ({"name": "Alice", "age": 30}, "address"),
+                ({"name": "Alice", "age": 30}, "address", "Unknown"),
+                ({}, "age", 0),
+            ],
         )
     else:
         exercise2_passed = False
@@ -3,7 +3,8 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from utils import lesson_ui, create_code_executor, create_exercise
+from dataset_registry import get_dataset
+from utils import lesson_ui, create_code_executor, create_exercise, show_code_figures
 
 def lesson_content():
     st.markdown("# Data Visualization in Python")
@@ -59,20 +60,7 @@ plt.show()
     
     st.code(code1, language='python')
     
-    # Create the matplotlib example plot
-    x = np.linspace(0, 10, 100)
-    y1 = np.sin(x)
-    y2 = np.cos(x)
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(x, y1, label='Sine', color='blue', linewidth=2)
-    ax.plot(x, y2, label='Cosine', color='red', linewidth=2, linestyle='--')
-    ax.set_xlabel('X-axis')
-    ax.set_ylabel('Y-axis')
-    ax.set_title('Sine and Cosine Functions')
-    ax.grid(True, alpha=0.3)
-    ax.legend()
-    st.pyplot(fig)
+    show_code_figures(code1)
     
     st.markdown("Try creating your own plot:")
     create_code_executor(code1)
@@ -108,21 +96,7 @@ plt.show()
     
     st.code(code2, language='python')
     
-    # Create scatter plot example
-    np.random.seed(42)
-    x = np.random.rand(50)
-    y = np.random.rand(50)
-    colors = np.random.rand(50)
-    sizes = 1000 * np.random.rand(50)
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    scatter = ax.scatter(x, y, c=colors, s=sizes, alpha=0.7, cmap='viridis')
-    plt.colorbar(scatter, ax=ax, label='Color Value')
-    ax.set_xlabel('X-axis')
-    ax.set_ylabel('Y-axis')
-    ax.set_title('Scatter Plot with Size and Color Variation')
-    ax.grid(True, alpha=0.3)
-    st.pyplot(fig)
+    show_code_figures(code2)
     
     st.markdown("### Bar Plot")
     code3 = """import matplotlib.pyplot as plt
@@ -145,17 +119,7 @@ plt.show()
     
     st.code(code3, language='python')
     
-    # Create bar plot example
-    categories = ['A', 'B', 'C', 'D', 'E']
-    values = [25, 40, 30, 55, 15]
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(categories, values, color='skyblue', edgecolor='navy')
-    ax.set_xlabel('Categories')
-    ax.set_ylabel('Values')
-    ax.set_title('Bar Plot Example')
-    ax.grid(axis='y', linestyle='--', alpha=0.7)
-    st.pyplot(fig)
+    show_code_figures(code3)
     
     st.markdown("### Histogram")
     code4 = """import matplotlib.pyplot as plt
@@ -178,17 +142,7 @@ plt.show()
     
     st.code(code4, language='python')
     
-    # Create histogram example
-    np.random.seed(42)
-    data = np.random.normal(0, 1, 1000)
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.hist(data, bins=30, color='green', alpha=0.7, edgecolor='black')
-    ax.set_xlabel('Value')
-    ax.set_ylabel('Frequency')
-    ax.set_title('Histogram of Normal Distribution')
-    ax.grid(axis='y', alpha=0.3)
-    st.pyplot(fig)
+    show_code_figures(code4)
     
     st.markdown("### Pie Chart")
     code5 = """import matplotlib.pyplot as plt
@@ -212,18 +166,7 @@ plt.show()
     
     st.code(code5, language='python')
     
-    # Create pie chart example
-    labels = ['A', 'B', 'C', 'D', 'E']
-    sizes = [15, 30, 25, 10, 20]
-    colors = ['gold', 'lightcoral', 'lightskyblue', 'lightgreen', 'lightpink']
-    explode = (0.1, 0, 0, 0, 0)
-    
-    fig, ax = plt.subplots(figsize=(8, 8))
-    ax.pie(sizes, explode=explode, labels=labels, colors=colors,
-           autopct='%1.1f%%', shadow=True, startangle=90)
-    ax.axis('equal')
-    ax.set_title('Pie Chart Example')
-    st.pyplot(fig)
+    show_code_figures(code5)
     
     st.markdown("Try creating these different types of plots:")
     create_code_executor(code3)  # Using the bar plot example as default
@@ -278,41 +221,7 @@ plt.show()
     
     st.code(code6, language='python')
     
-    # Create subplots example
-    x = np.linspace(0, 5, 100)
-    y1 = np.sin(x)
-    y2 = np.exp(-x)
-    y3 = x**2
-    y4 = np.log(x + 1)
-    
-    fig, axes = plt.subplots(2, 2, figsize=(12, 10))
-    
-    axes[0, 0].plot(x, y1, 'b-')
-    axes[0, 0].set_title('Sine Function')
-    axes[0, 0].set_xlabel('x')
-    axes[0, 0].set_ylabel('sin(x)')
-    axes[0, 0].grid(True)
-    
-    axes[0, 1].plot(x, y2, 'r-')
-    axes[0, 1].set_title('Exponential Decay')
-    axes[0, 1].set_xlabel('x')
-    axes[0, 1].set_ylabel('exp(-x)')
-    axes[0, 1].grid(True)
-    
-    axes[1, 0].plot(x, y3, 'g-')
-    axes[1, 0].set_title('Quadratic Function')
-    axes[1, 0].set_xlabel('x')
-    axes[1, 0].set_ylabel('x²')
-    axes[1, 0].grid(True)
-    
-    axes[1, 1].plot(x, y4, 'y-')
-    axes[1, 1].set_title('Logarithmic Function')
-    axes[1, 1].set_xlabel('x')
-    axes[1, 1].set_ylabel('log(x+1)')
-    axes[1, 1].grid(True)
-    
-    plt.tight_layout()
-    st.pyplot(fig)
+    show_code_figures(code6)
     
     st.markdown("Try creating subplots:")
     create_code_executor(code6)
@@ -361,27 +270,13 @@ plt.show()
     
     st.code(code7, language='python')
     
-    # Create seaborn example
-    sns.set_theme(style="whitegrid")
+    show_code_figures(code7)
     
-    # Create a dataset
-    np.random.seed(42)
-    tips = pd.DataFrame({
-        'total_bill': np.random.uniform(10, 50, 200),
-        'tip': np.random.uniform(1, 10, 200),
-        'sex': np.random.choice(['Male', 'Female'], 200),
-        'smoker': np.random.choice(['Yes', 'No'], 200),
-        'day': np.random.choice(['Sun', 'Sat', 'Fri', 'Thur'], 200),
-        'time': np.random.choice(['Dinner', 'Lunch'], 200),
-        'size': np.random.choice([1, 2, 3, 4, 5, 6], 200)
-    })
+    # The examples below draw from the same dataset in the page itself
+    sns.set_theme(style="whitegrid")
     
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.scatterplot(x='total_bill', y='tip', data=tips, hue='time', style='time', s=100, ax=ax)
-    ax.set_title('Relationship between Total Bill and Tip')
-    ax.set_xlabel('Total Bill ($)')
-    ax.set_ylabel('Tip ($)')
-    st.pyplot(fig)
+    # The same dataset as in the example above, built once per server (see dataset_registry.py)
+    tips = get_dataset("tips")
     
     st.markdown("## Common Seaborn Plots")
     
@@ -424,6 +319,7 @@ plt.show()
     ax.set_xlabel('Day')
     ax.set_ylabel('Average Total Bill ($)')
     st.pyplot(fig)
+    plt.close(fig)
     
     fig, ax = plt.subplots(figsize=(10, 6))
     sns.boxplot(x='day', y='total_bill', data=tips, ax=ax)
@@ -431,6 +327,7 @@ plt.show()
     ax.set_xlabel('Day')
     ax.set_ylabel('Total Bill ($)')
     st.pyplot(fig)
+    plt.close(fig)
     
     fig, ax = plt.subplots(figsize=(10, 6))
     sns.violinplot(x='day', y='total_bill', data=tips, hue='time', split=True, ax=ax)
@@ -438,6 +335,7 @@ plt.show()
     ax.set_xlabel('Day')
     ax.set_ylabel('Total Bill ($)')
     st.pyplot(fig)
+    plt.close(fig)
     
     st.markdown("### Distribution Plots")
     
@@ -477,6 +375,7 @@ plt.show()
     ax.set_xlabel('Total Bill ($)')
     ax.set_ylabel('Count')
     st.pyplot(fig)
+    plt.close(fig)
     
     fig, ax = plt.subplots(figsize=(10, 6))
     sns.kdeplot(data=tips, x='total_bill', hue='time', fill=True, common_norm=False, palette="crest", alpha=.5, ax=ax)
@@ -484,11 +383,13 @@ plt.show()
     ax.set_xlabel('Total Bill ($)')
     ax.set_ylabel('Density')
     st.pyplot(fig)
+    plt.close(fig)
     
     # Pair plot (this will be larger)
     pairgrid = sns.pairplot(tips[['total_bill', 'tip', 'size']], hue='size', height=2.5)
     pairgrid.fig.suptitle('Pair Plot of Tips Dataset (Subset)', y=1.02)
     st.pyplot(pairgrid.fig)
+    plt.close(pairgrid.fig)
     
     st.markdown("Try creating seaborn plots:")
     create_code_executor(code8)
@@ -544,13 +445,14 @@ plt.show()
     
     st.code(code10, language='python')
     
-    # Pandas plotting examples
+    # Pandas plotting examples (seeded, so reruns show the same plots)
+    rng = np.random.RandomState(42)
     dates = pd.date_range('20230101', periods=100)
     df = pd.DataFrame({
-        'A': np.random.randn(100).cumsum(),
-        'B': np.random.randn(100).cumsum(),
-        'C': np.random.randn(100).cumsum(),
-        'D': np.random.randn(100).cumsum()
+        'A': rng.randn(100).cumsum(),
+        'B': rng.randn(100).cumsum(),
+        'C': rng.randn(100).cumsum(),
+        'D': rng.randn(100).cumsum()
     }, index=dates)
     
     st.markdown("Line Plot Output:")
@@ -560,6 +462,7 @@ plt.show()
     ax.set_ylabel('Value')
     ax.grid(True)
     st.pyplot(fig)
+    plt.close(fig)
     
     st.markdown("Bar Plot Output:")
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -568,6 +471,7 @@ plt.show()
     ax.set_ylabel('Value')
     ax.grid(True)
     st.pyplot(fig)
+    plt.close(fig)
     
     st.markdown("Line Plot Output (safer than area plot):")
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -576,6 +480,7 @@ plt.show()
     ax.set_ylabel('Value')
     ax.grid(True)
     st.pyplot(fig)
+    plt.close(fig)
     
     st.markdown("Scatter Plot Output:")
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -585,6 +490,7 @@ plt.show()
     ax.set_ylabel('B')
     ax.grid(True)
     st.pyplot(fig)
+    plt.close(fig)
     
     st.markdown("Try pandas plotting:")
     create_code_executor(code10)
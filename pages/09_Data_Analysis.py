@@ -4,6 +4,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
+from dataset_registry import get_dataset
 from utils import lesson_ui, create_code_executor, create_exercise
 
 def lesson_content():
@@ -147,23 +148,8 @@ print("Customers:", df['customer_id'].nunique())
     
     st.code(code2, language='python')
     
-    # Create a simulated dataset
-    np.random.seed(42)
-    n_samples = 1000
-    
-    # Create a DataFrame with simulated sales data
-    dates = pd.date_range('20230101', periods=n_samples)
-    sales_df = pd.DataFrame({
-        'date': dates,
-        'product_id': np.random.choice(['P001', 'P002', 'P003', 'P004', 'P005'], n_samples),
-        'category': np.random.choice(['Electronics', 'Clothing', 'Books', 'Home', 'Food'], n_samples),
-        'quantity': np.random.randint(1, 10, n_samples),
-        'price': np.round(np.random.uniform(10, 100, n_samples), 2),
-        'customer_id': np.random.choice(['C' + str(i).zfill(3) for i in range(1, 201)], n_samples)
-    })
-    
-    # Calculate total sales
-    sales_df['total_sales'] = sales_df['quantity'] * sales_df['price']
+    # The simulated dataset from the example above, built once per server (see dataset_registry.py)
+    sales_df = get_dataset("sales_df")
     
     st.markdown("First 5 rows:")
     st.dataframe(sales_df.head())
@@ -264,8 +250,8 @@ print(pivot)
     top_sales = sales_df.sort_values('total_sales', ascending=False)
     st.dataframe(top_sales.head())
     
-    # Add discount column for demonstration
-    sales_df['discount'] = np.round(np.random.uniform(0, 0.3, len(sales_df)), 2)
+    # Add discount column for demonstration (seeded, so reruns show the same discounts)
+    sales_df['discount'] = np.round(np.random.RandomState(42).uniform(0, 0.3, len(sales_df)), 2)
     sales_df['discounted_sales'] = sales_df['total_sales'] * (1 - sales_df['discount'])
     
     st.markdown("Total sales by category:")
@@ -626,7 +612,8 @@ print(f"Month with lowest sales: {min_month.strftime('%B %Y')}: ${monthly_sales[
 
         exercise2_passed = create_exercise(
             "Create a time series dataset of daily sales for a full year (365 days) with random fluctuations and seasonal patterns. Calculate a 7-day moving average and plot both the daily sales and the moving average. Additionally, resample the data to find monthly sales totals and identify which month had the highest and lowest sales.",
-            exercise2_solution
+            exercise2_solution,
+            requires=["call rolling", "call resample"],
         )
     else:
         exercise2_passed = False
@@ -0,0 +1,83 @@
+import hmac
+import os
+import time
+import streamlit as st
+import pandas as pd
+from grading import discover_exercises, exercise_id
+from progress_store import (
+    COMPLETION_TIME_LABELS, MAX_ATTEMPT_BUCKET, PROGRESS_COMPACT_INTERVAL, get_progress_store, histogram_median,
+)
+
+# When set, the dashboard asks for this password
+INSTRUCTOR_PASSWORD = os.environ.get("INSTRUCTOR_PASSWORD")
+
+def percent(part, whole):
+    return f"{100 * part / whole:.0f}%" if whole else "-"
+
+def short(prompt, length=80):
+    line = prompt.strip().splitlines()[0]
+    return line if len(line) <= length else line[:length - 1] + "…"
+
+def dashboard():
+    # Everything shown comes from the rollup tables, which are kept up to date
+    # as the progress log is compacted, so this page costs the same for any
+    # number of learners
+    rollups = get_progress_store().rollups()
+    if rollups.compacted_at is None:
+        st.info("No learner progress has been summarized yet. Check back in a few minutes.")
+        return
+    st.caption(
+        f"Includes progress up to {time.strftime('%Y-%m-%d %H:%M', time.localtime(rollups.compacted_at))}, "
+        f"updated every {PROGRESS_COMPACT_INTERVAL / 60:g} minutes."
+    )
+
+    st.subheader("Lessons")
+    lesson_rows = []
+    for lesson, (started, completed) in sorted(rollups.lessons.items()):
+        median = histogram_median(rollups.completion_times.get(lesson, {}))
+        lesson_rows.append({
+            "Lesson": lesson,
+            "Started": started,
+            "Completed": completed,
+            "Completion rate": percent(completed, started),
+            "Median time to complete": COMPLETION_TIME_LABELS[median] if median is not None else "-",
+        })
+    st.dataframe(pd.DataFrame(lesson_rows), hide_index=True, use_container_width=True)
+    st.caption("A lesson counts as started at a learner's first exercise check in it, or when it is "
+               "marked complete without one, and its time to complete runs from the first check "
+               "to the first time it is marked complete.")
+
+    st.subheader("Exercises")
+    prompts = {exercise_id(exercise.prompt): short(exercise.prompt) for exercise in discover_exercises()}
+    exercise_rows = []
+    for exercise, (lesson, learners, passed, attempts) in sorted(rollups.exercises.items(), key=lambda item: str(item[1][0])):
+        exercise_rows.append({
+            "Lesson": lesson,
+            "Exercise": prompts.get(exercise, exercise),
+            "Learners": learners,
+            "Passed": passed,
+            "Pass rate": percent(passed, learners),
+            "Checks per learner": round(attempts / learners, 1) if learners else 0,
+        })
+    st.dataframe(pd.DataFrame(exercise_rows), hide_index=True, use_container_width=True)
+
+    if rollups.attempts:
+        st.subheader("Checks per learner")
+        exercise = st.selectbox("Exercise", list(rollups.attempts), format_func=lambda key: prompts.get(key, key))
+        histogram = rollups.attempts[exercise]
+        buckets = range(1, MAX_ATTEMPT_BUCKET + 1)
+        chart = pd.DataFrame({"Learners": [histogram.get(bucket, 0) for bucket in buckets]}, index=buckets)
+        chart.index.name = "Checks"
+        st.bar_chart(chart)
+        st.caption(f"Learners by how many times they checked this exercise; {MAX_ATTEMPT_BUCKET} includes more.")
+
+st.title("📊 Instructor Dashboard")
+
+if INSTRUCTOR_PASSWORD:
+    password = st.text_input("Instructor password", type="password")
+    if not hmac.compare_digest(password.encode(), INSTRUCTOR_PASSWORD.encode()):
+        if password:
+            st.error("Wrong password.")
+        st.stop()
+
+dashboard()
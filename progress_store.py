@@ -0,0 +1,786 @@
+"""Learner progress stored in SQLite.
+
+Progress used to live in user_progress.json, which every change rewrote
+in full. Here progress is an append-only log of events (a lesson completed
+or reset, an exercise checked or passed), so recording one is a single
+insert however much the learner has done before, and the history stays
+available. A learner's current progress is the `progress` and `exercises`
+snapshot tables plus the events logged after the snapshot; `compact()`
+folds that tail into the snapshot and drops events older than
+PROGRESS_EVENT_RETENTION_DAYS. The databases run in WAL mode, so readers
+never wait for the writer.
+
+Learners are spread over PROGRESS_SHARDS database files by a hash of
+their id, so sessions of different learners rarely wait for the same
+write lock. The app goes through a ProgressWriter, which keeps the
+progress of recently seen learners in memory while a background thread
+appends the events in batches and compacts the log, so a page never waits
+for disk.
+
+The old JSON file is imported once, under DEFAULT_LEARNER, the first time
+the store is opened. `python progress_store.py benchmark` measures write
+throughput with many concurrent sessions.
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+PROGRESS_DB_PATH = Path(os.environ.get("PROGRESS_DB_PATH", "progress.db"))
+PROGRESS_SHARDS = int(os.environ.get("PROGRESS_SHARDS", 8))
+# Buffered events are written after this many seconds, or once this many are waiting
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", 1.0))
+PROGRESS_FLUSH_ROWS = int(os.environ.get("PROGRESS_FLUSH_ROWS", 500))
+PROGRESS_COMPACT_INTERVAL = float(os.environ.get("PROGRESS_COMPACT_INTERVAL", 300))
+PROGRESS_EVENT_RETENTION_DAYS = float(os.environ.get("PROGRESS_EVENT_RETENTION_DAYS", 90))
+# Learners whose progress the writer keeps in memory
+PROGRESS_CACHE_LEARNERS = int(os.environ.get("PROGRESS_CACHE_LEARNERS", 10000))
+LEGACY_PROGRESS_PATH = Path("user_progress.json")
+
+# Upper bounds in seconds of the buckets times to complete a lesson are counted in
+COMPLETION_TIME_BUCKETS = [60, 5 * 60, 15 * 60, 30 * 60, 3600, 3 * 3600, 86400, 3 * 86400, 7 * 86400]
+COMPLETION_TIME_LABELS = [
+    "< 1 min", "1-5 min", "5-15 min", "15-30 min", "30-60 min", "1-3 h", "3-24 h", "1-3 days", "3-7 days", "> 7 days",
+]
+# Checks of an exercise are counted per learner up to this, the last bucket being "this many or more"
+MAX_ATTEMPT_BUCKET = 10
+
+# Learner the shared progress of the JSON file belongs to
+DEFAULT_LEARNER = "default"
+
+EVENT_COMPLETE = "complete"
+EVENT_RESET = "reset"
+# An exercise checked without passing, and one that passed
+EVENT_ATTEMPT = "attempt"
+EVENT_PASS = "pass"
+EVENT_KINDS = (EVENT_COMPLETE, EVENT_RESET, EVENT_ATTEMPT, EVENT_PASS)
+
+ProgressEvent = namedtuple("ProgressEvent", ["learner_id", "kind", "lesson", "exercise", "at"])
+# lessons: {lesson: completed}; exercises: {exercise: [attempts, passed, lesson]}
+LearnerProgress = namedtuple("LearnerProgress", ["lessons", "exercises"])
+# Cohort aggregates, see ProgressStore.rollups()
+CohortRollups = namedtuple("CohortRollups", ["lessons", "exercises", "attempts", "completion_times", "compacted_at"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    learner_id TEXT NOT NULL,
+    lesson TEXT NOT NULL,
+    completed INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (learner_id, lesson)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS exercises (
+    learner_id TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    lesson TEXT,
+    attempts INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (learner_id, exercise)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    learner_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    lesson TEXT,
+    exercise TEXT,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_learner ON events (learner_id, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO progress (learner_id, lesson, completed, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (learner_id, lesson) DO UPDATE SET
+    completed = excluded.completed,
+    updated_at = excluded.updated_at
+"""
+
+_APPEND = "INSERT INTO events (learner_id, kind, lesson, exercise, at) VALUES (?, ?, ?, ?, ?)"
+
+# Fields of an exported progress record: a lesson when `exercise` is None, else an exercise
+RECORD_FIELDS = ["learner_id", "lesson", "exercise", "completed", "attempts", "passed", "updated_at"]
+
+_EXPORT = """
+SELECT learner_id, lesson, NULL, completed, NULL, NULL, updated_at FROM progress
+UNION ALL
+SELECT learner_id, lesson, exercise, NULL, attempts, passed, updated_at FROM exercises
+"""
+
+# Imports replace the snapshot row unless it changed after the imported one, so importing twice changes nothing
+_IMPORT_LESSON = """
+INSERT INTO progress (learner_id, lesson, completed, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (learner_id, lesson) DO UPDATE SET
+    completed = excluded.completed,
+    updated_at = excluded.updated_at
+WHERE excluded.updated_at >= progress.updated_at
+"""
+
+_IMPORT_EXERCISE = """
+INSERT INTO exercises (learner_id, exercise, lesson, attempts, passed, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (learner_id, exercise) DO UPDATE SET
+    lesson = coalesce(excluded.lesson, lesson),
+    attempts = excluded.attempts,
+    passed = excluded.passed,
+    updated_at = excluded.updated_at
+WHERE excluded.updated_at >= exercises.updated_at
+"""
+
+# Compaction: fold events (snapshot seq, last seq] into the snapshot tables, as apply_event() would
+_FOLD_LESSONS = """
+INSERT INTO progress (learner_id, lesson, completed, updated_at)
+SELECT learner_id, lesson, kind = 'complete', at FROM events
+WHERE seq > ? AND seq <= ? AND kind IN ('complete', 'reset')
+ORDER BY seq
+ON CONFLICT (learner_id, lesson) DO UPDATE SET
+    completed = excluded.completed,
+    updated_at = excluded.updated_at
+"""
+
+_FOLD_EXERCISES = """
+INSERT INTO exercises (learner_id, exercise, lesson, attempts, passed, updated_at)
+SELECT learner_id, exercise, max(lesson), count(*), max(kind = 'pass'), max(at) FROM events
+WHERE seq > ? AND seq <= ? AND kind IN ('attempt', 'pass')
+GROUP BY learner_id, exercise
+ON CONFLICT (learner_id, exercise) DO UPDATE SET
+    lesson = coalesce(excluded.lesson, lesson),
+    attempts = attempts + excluded.attempts,
+    passed = max(passed, excluded.passed),
+    updated_at = excluded.updated_at
+"""
+
+
+def _bucket_case(expression, bounds):
+    whens = " ".join(f"WHEN {expression} < {bound} THEN {i}" for i, bound in enumerate(bounds))
+    return f"CASE {whens} ELSE {len(bounds)} END"
+
+
+# Aggregates over all learners of a shard, kept up to date by triggers on
+# the snapshot tables, so reading them doesn't depend on the cohort size.
+# A lesson counts as started at the learner's first exercise check in it,
+# or when it is completed without one (say, in migrated or imported
+# progress); its time to complete is then unknown, so completed_at stays NULL.
+_ROLLUP_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS lesson_started (
+    learner_id TEXT NOT NULL,
+    lesson TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    completed_at REAL,
+    PRIMARY KEY (learner_id, lesson)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lesson_stats (
+    lesson TEXT PRIMARY KEY,
+    started INTEGER NOT NULL,
+    completed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exercise_stats (
+    exercise TEXT PRIMARY KEY,
+    lesson TEXT,
+    learners INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    attempts INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempt_histogram (
+    exercise TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    learners INTEGER NOT NULL,
+    PRIMARY KEY (exercise, bucket)
+);
+CREATE TABLE IF NOT EXISTS completion_times (
+    lesson TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    learners INTEGER NOT NULL,
+    PRIMARY KEY (lesson, bucket)
+);
+
+CREATE TRIGGER IF NOT EXISTS progress_inserted AFTER INSERT ON progress BEGIN
+    INSERT INTO lesson_stats (lesson, started, completed) VALUES (new.lesson, 0, new.completed)
+    ON CONFLICT (lesson) DO UPDATE SET completed = completed + excluded.completed;
+END;
+CREATE TRIGGER IF NOT EXISTS progress_updated AFTER UPDATE OF completed ON progress BEGIN
+    UPDATE lesson_stats SET completed = completed + new.completed - old.completed WHERE lesson = new.lesson;
+END;
+CREATE TRIGGER IF NOT EXISTS progress_first_completed AFTER UPDATE OF completed, updated_at ON progress
+WHEN new.completed = 1 AND old.completed = 0 BEGIN
+    UPDATE lesson_started SET completed_at = new.updated_at
+    WHERE learner_id = new.learner_id AND lesson = new.lesson AND completed_at IS NULL AND started_at <= new.updated_at;
+    -- Not INSERT OR IGNORE: the conflict policy of the UPSERT that fires the trigger would override it
+    INSERT INTO lesson_started (learner_id, lesson, started_at) VALUES (new.learner_id, new.lesson, new.updated_at)
+    ON CONFLICT DO NOTHING;
+END;
+CREATE TRIGGER IF NOT EXISTS progress_inserted_completed AFTER INSERT ON progress WHEN new.completed = 1 BEGIN
+    UPDATE lesson_started SET completed_at = new.updated_at
+    WHERE learner_id = new.learner_id AND lesson = new.lesson AND completed_at IS NULL AND started_at <= new.updated_at;
+    -- Not INSERT OR IGNORE: the conflict policy of the UPSERT that fires the trigger would override it
+    INSERT INTO lesson_started (learner_id, lesson, started_at) VALUES (new.learner_id, new.lesson, new.updated_at)
+    ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER IF NOT EXISTS lesson_started_inserted AFTER INSERT ON lesson_started BEGIN
+    INSERT INTO lesson_stats (lesson, started, completed) VALUES (new.lesson, 1, 0)
+    ON CONFLICT (lesson) DO UPDATE SET started = started + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS lesson_started_completed AFTER UPDATE OF completed_at ON lesson_started
+WHEN old.completed_at IS NULL AND new.completed_at IS NOT NULL BEGIN
+    INSERT INTO completion_times (lesson, bucket, learners)
+    VALUES (new.lesson, {_bucket_case("new.completed_at - new.started_at", COMPLETION_TIME_BUCKETS)}, 1)
+    ON CONFLICT (lesson, bucket) DO UPDATE SET learners = learners + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS exercises_inserted AFTER INSERT ON exercises BEGIN
+    INSERT INTO exercise_stats (exercise, lesson, learners, passed, attempts)
+    VALUES (new.exercise, new.lesson, 1, new.passed, new.attempts)
+    ON CONFLICT (exercise) DO UPDATE SET
+        lesson = coalesce(excluded.lesson, lesson),
+        learners = learners + 1,
+        passed = passed + excluded.passed,
+        attempts = attempts + excluded.attempts;
+    INSERT INTO attempt_histogram (exercise, bucket, learners)
+    VALUES (new.exercise, min(new.attempts, {MAX_ATTEMPT_BUCKET}), 1)
+    ON CONFLICT (exercise, bucket) DO UPDATE SET learners = learners + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS exercises_updated AFTER UPDATE OF attempts, passed ON exercises BEGIN
+    UPDATE exercise_stats SET
+        passed = passed + new.passed - old.passed,
+        attempts = attempts + new.attempts - old.attempts
+    WHERE exercise = new.exercise;
+    UPDATE attempt_histogram SET learners = learners - 1
+    WHERE exercise = old.exercise AND bucket = min(old.attempts, {MAX_ATTEMPT_BUCKET});
+    INSERT INTO attempt_histogram (exercise, bucket, learners)
+    VALUES (new.exercise, min(new.attempts, {MAX_ATTEMPT_BUCKET}), 1)
+    ON CONFLICT (exercise, bucket) DO UPDATE SET learners = learners + 1;
+END;
+"""
+
+# Bump when the rollups are computed differently, so existing databases recompute them
+ROLLUP_VERSION = 3
+
+# Recompute every rollup from the snapshot tables
+_REBUILD_ROLLUPS = f"""
+INSERT OR IGNORE INTO lesson_started (learner_id, lesson, started_at)
+SELECT learner_id, lesson, updated_at FROM progress WHERE completed = 1;
+DELETE FROM lesson_stats;
+DELETE FROM exercise_stats;
+DELETE FROM attempt_histogram;
+DELETE FROM completion_times;
+INSERT INTO lesson_stats (lesson, started, completed)
+SELECT lesson, 0, sum(completed) FROM progress GROUP BY lesson;
+INSERT INTO lesson_stats (lesson, started, completed)
+SELECT lesson, count(*), 0 FROM lesson_started WHERE true GROUP BY lesson
+ON CONFLICT (lesson) DO UPDATE SET started = excluded.started;
+INSERT INTO exercise_stats (exercise, lesson, learners, passed, attempts)
+SELECT exercise, max(lesson), count(*), sum(passed), sum(attempts) FROM exercises GROUP BY exercise;
+INSERT INTO attempt_histogram (exercise, bucket, learners)
+SELECT exercise, min(attempts, {MAX_ATTEMPT_BUCKET}), count(*) FROM exercises GROUP BY 1, 2;
+INSERT INTO completion_times (lesson, bucket, learners)
+SELECT lesson, {_bucket_case("completed_at - started_at", COMPLETION_TIME_BUCKETS)}, count(*) FROM lesson_started
+WHERE completed_at IS NOT NULL GROUP BY 1, 2;
+"""
+
+# Before folding a stretch of the log: when each learner first checked an exercise of each lesson
+_FOLD_STARTED = """
+INSERT OR IGNORE INTO lesson_started (learner_id, lesson, started_at)
+SELECT learner_id, lesson, min(at) FROM events
+WHERE seq > ? AND seq <= ? AND kind IN ('attempt', 'pass') AND lesson IS NOT NULL
+GROUP BY learner_id, lesson
+"""
+
+
+def histogram_median(histogram):
+    """Return the bucket holding the median of a {bucket: count} histogram, or None if it is empty"""
+    remaining = (sum(histogram.values()) + 1) // 2
+    if not remaining:
+        return None
+    for bucket in sorted(histogram):
+        remaining -= histogram[bucket]
+        if remaining <= 0:
+            return bucket
+
+
+def apply_event(progress, event):
+    """Update a LearnerProgress with one event"""
+    if event.kind == EVENT_COMPLETE:
+        progress.lessons[event.lesson] = 1
+    elif event.kind == EVENT_RESET:
+        progress.lessons[event.lesson] = 0
+    elif event.kind in (EVENT_ATTEMPT, EVENT_PASS):
+        exercise = progress.exercises.setdefault(event.exercise, [0, 0, event.lesson])
+        exercise[0] += 1
+        if event.kind == EVENT_PASS:
+            exercise[1] = 1
+    else:
+        raise ValueError(f"Unknown progress event: {event.kind!r}")
+
+
+def _rollup_version(db):
+    row = db.execute("SELECT value FROM meta WHERE key = 'rollup_version'").fetchone()
+    return int(row[0]) if row else None
+
+
+def _snapshot_seq(db):
+    row = db.execute("SELECT value FROM meta WHERE key = 'snapshot_seq'").fetchone()
+    return int(row[0]) if row else 0
+
+
+class ProgressStore:
+    """Per-learner progress events and their snapshot in one SQLite database"""
+
+    def __init__(self, path=PROGRESS_DB_PATH):
+        self.path = Path(path)
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        self._local = threading.local()
+        db = self._connect()
+        db.executescript(_SCHEMA)
+        if _rollup_version(db) != ROLLUP_VERSION:
+            # CREATE TRIGGER IF NOT EXISTS keeps triggers of an older version, so drop them first
+            triggers = [name for name, in db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")]
+            db.executescript("".join(f"DROP TRIGGER IF EXISTS {name};" for name in triggers))
+        db.executescript(_ROLLUP_SCHEMA)
+        with self.transaction() as db:
+            if _rollup_version(db) != ROLLUP_VERSION:
+                for statement in _REBUILD_ROLLUPS.split(";"):
+                    db.execute(statement)
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup_version', ?)", (str(ROLLUP_VERSION),))
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints; a crash can lose at most the last commits, never corrupt
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Connection with an open write transaction, committed on success"""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Connection with an open read transaction, so all queries see the same state"""
+        db = self._connect()
+        db.execute("BEGIN")
+        try:
+            yield db
+        finally:
+            db.execute("COMMIT")
+
+    def load(self, learner_id):
+        """Return a learner's LearnerProgress: the snapshot plus the events logged after it"""
+        progress = LearnerProgress({}, {})
+        with self.reading() as db:
+            rows = db.execute("SELECT lesson, completed FROM progress WHERE learner_id = ?", (learner_id,))
+            progress.lessons.update(rows)
+            rows = db.execute(
+                "SELECT exercise, attempts, passed, lesson FROM exercises WHERE learner_id = ?", (learner_id,)
+            )
+            for exercise, attempts, passed, lesson in rows:
+                progress.exercises[exercise] = [attempts, passed, lesson]
+            rows = db.execute(
+                "SELECT learner_id, kind, lesson, exercise, at FROM events WHERE learner_id = ? AND seq > ? ORDER BY seq",
+                (learner_id, _snapshot_seq(db)),
+            )
+            for row in rows:
+                apply_event(progress, ProgressEvent._make(row))
+        return progress
+
+    def get(self, learner_id):
+        """Return {lesson: completed} for a learner"""
+        return self.load(learner_id).lessons
+
+    def append(self, events):
+        """Add ProgressEvents to the log in one transaction"""
+        with self.transaction() as db:
+            db.executemany(_APPEND, events)
+
+    def set(self, learner_id, lesson, completed):
+        """Record that a learner completed or reset a lesson"""
+        self.append([ProgressEvent(learner_id, EVENT_COMPLETE if completed else EVENT_RESET, lesson, None, time.time())])
+
+    def compact(self, retention_days=PROGRESS_EVENT_RETENTION_DAYS):
+        """Fold the events logged since the last snapshot into it; returns how many were folded
+
+        Folded events older than `retention_days` are deleted.
+        """
+        with self.transaction() as db:
+            start = _snapshot_seq(db)
+            end = db.execute("SELECT max(seq) FROM events").fetchone()[0] or start
+            if end > start:
+                db.execute(_FOLD_STARTED, (start, end))
+                db.execute(_FOLD_LESSONS, (start, end))
+                db.execute(_FOLD_EXERCISES, (start, end))
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('snapshot_seq', ?)", (str(end),))
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('compacted_at', ?)", (str(time.time()),))
+            db.execute("DELETE FROM events WHERE seq <= ? AND at < ?", (end, time.time() - retention_days * 86400))
+        return end - start
+
+    def records(self, batch_size=10000):
+        """Yield every snapshot row as a tuple of RECORD_FIELDS, reading `batch_size` rows at a time
+
+        Events not compacted yet are not included.
+        """
+        with self.reading() as db:
+            cursor = db.execute(_EXPORT)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def import_records(self, records):
+        """Upsert tuples of RECORD_FIELDS into the snapshot in one transaction"""
+        with self.transaction() as db:
+            db.executemany(_IMPORT_LESSON, (
+                (learner_id, lesson, completed, updated_at)
+                for learner_id, lesson, exercise, completed, _, _, updated_at in records if exercise is None
+            ))
+            db.executemany(_IMPORT_EXERCISE, (
+                (learner_id, exercise, lesson, attempts, passed, updated_at)
+                for learner_id, lesson, exercise, _, attempts, passed, updated_at in records if exercise is not None
+            ))
+
+    def rollups(self):
+        """Return the CohortRollups of this database, as of the last compaction"""
+        rollups = CohortRollups({}, {}, {}, {}, None)
+        with self.reading() as db:
+            for lesson, started, completed in db.execute("SELECT lesson, started, completed FROM lesson_stats"):
+                rollups.lessons[lesson] = [started, completed]
+            rows = db.execute("SELECT exercise, lesson, learners, passed, attempts FROM exercise_stats")
+            for exercise, lesson, learners, passed, attempts in rows:
+                rollups.exercises[exercise] = [lesson, learners, passed, attempts]
+            for exercise, bucket, learners in db.execute("SELECT exercise, bucket, learners FROM attempt_histogram"):
+                rollups.attempts.setdefault(exercise, {})[bucket] = learners
+            for lesson, bucket, learners in db.execute("SELECT lesson, bucket, learners FROM completion_times"):
+                rollups.completion_times.setdefault(lesson, {})[bucket] = learners
+            row = db.execute("SELECT value FROM meta WHERE key = 'compacted_at'").fetchone()
+        return rollups._replace(compacted_at=float(row[0]) if row else None)
+
+    def migrate_json(self, json_path=LEGACY_PROGRESS_PATH, learner_id=DEFAULT_LEARNER):
+        """Import a user_progress.json file once; returns the number of lessons imported"""
+        json_path = Path(json_path)
+        with self.transaction() as db:
+            marker = f"migrated:{json_path.resolve()}"
+            if db.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+            try:
+                with open(json_path, "r") as f:
+                    lessons = json.load(f)
+            except (OSError, ValueError):
+                lessons = {}
+            now = time.time()
+            # Straight into the snapshot: there is no history to log
+            db.executemany(_UPSERT, [(learner_id, lesson, int(done), now) for lesson, done in lessons.items()])
+            db.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(now)))
+        return len(lessons)
+
+
+def _add_counts(total, counts, offset=0):
+    for i, count in enumerate(counts, offset):
+        total[i] += count
+
+
+class ShardedProgressStore:
+    """ProgressStore split over several database files by learner id
+
+    Shard i of `path` progress.db is progress-i.db; with a single shard the
+    path itself is used.
+    """
+
+    def __init__(self, path=PROGRESS_DB_PATH, shards=PROGRESS_SHARDS):
+        path = Path(path)
+        if shards == 1:
+            self.shards = [ProgressStore(path)]
+        else:
+            self.shards = [ProgressStore(path.with_name(f"{path.stem}-{i}{path.suffix}")) for i in range(shards)]
+
+    def shard_for(self, learner_id):
+        """Return the store a learner's rows live in"""
+        # crc32 rather than hash(): the mapping must not change between processes
+        return self.shards[zlib.crc32(learner_id.encode("utf-8")) % len(self.shards)]
+
+    def load(self, learner_id):
+        return self.shard_for(learner_id).load(learner_id)
+
+    def get(self, learner_id):
+        return self.shard_for(learner_id).get(learner_id)
+
+    def set(self, learner_id, lesson, completed):
+        self.shard_for(learner_id).set(learner_id, lesson, completed)
+
+    def compact(self, retention_days=PROGRESS_EVENT_RETENTION_DAYS):
+        return sum(shard.compact(retention_days) for shard in self.shards)
+
+    def rollups(self):
+        """Return the CohortRollups of all shards added together"""
+        total = CohortRollups({}, {}, {}, {}, None)
+        for rollups in map(ProgressStore.rollups, self.shards):
+            for lesson, counts in rollups.lessons.items():
+                _add_counts(total.lessons.setdefault(lesson, [0, 0]), counts)
+            for exercise, (lesson, *counts) in rollups.exercises.items():
+                stats = total.exercises.setdefault(exercise, [lesson, 0, 0, 0])
+                stats[0] = stats[0] or lesson
+                _add_counts(stats, counts, offset=1)
+            for histograms, shard_histograms in ((total.attempts, rollups.attempts),
+                                                 (total.completion_times, rollups.completion_times)):
+                for key, histogram in shard_histograms.items():
+                    merged = histograms.setdefault(key, {})
+                    for bucket, learners in histogram.items():
+                        merged[bucket] = merged.get(bucket, 0) + learners
+            if rollups.compacted_at is not None:
+                # The oldest shard compaction: everything before it is included
+                total = total._replace(compacted_at=min(rollups.compacted_at, total.compacted_at or rollups.compacted_at))
+        return total
+
+    def migrate_json(self, json_path=LEGACY_PROGRESS_PATH, learner_id=DEFAULT_LEARNER):
+        return self.shard_for(learner_id).migrate_json(json_path, learner_id)
+
+
+class ProgressWriter:
+    """Write-behind event log in front of a ShardedProgressStore
+
+    `record()` applies the event to the learner's progress in memory and
+    buffers it; a background thread appends everything buffered every
+    `interval` seconds, or as soon as `max_rows` events are waiting, in one
+    transaction per shard, and compacts the log every `compact_interval`
+    seconds. The progress of the `max_learners` most recently seen learners
+    stays in memory. `close()` writes what is left before the process exits.
+    """
+
+    def __init__(self, store, interval=PROGRESS_FLUSH_INTERVAL, max_rows=PROGRESS_FLUSH_ROWS,
+                 compact_interval=PROGRESS_COMPACT_INTERVAL, max_learners=PROGRESS_CACHE_LEARNERS):
+        self.store = store
+        self.interval = interval
+        self.max_rows = max_rows
+        self.compact_interval = compact_interval
+        self.max_learners = max_learners
+        # learner id -> LearnerProgress, least recently used first
+        self._learners = OrderedDict()
+        # Events not written yet, oldest first
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_forever, name="progress-writer", daemon=True)
+        self._thread.start()
+
+    def _progress(self, learner_id):
+        with self._lock:
+            progress = self._learners.get(learner_id)
+            if progress is not None:
+                self._learners.move_to_end(learner_id)
+                return progress
+        # While the flush lock is held no events move from the buffer to the
+        # database, so each one is either read from disk or applied below
+        with self._flush_lock:
+            progress = self.store.load(learner_id)
+            with self._lock:
+                if learner_id in self._learners:
+                    return self._learners[learner_id]
+                for event in self._pending:
+                    if event.learner_id == learner_id:
+                        apply_event(progress, event)
+                self._learners[learner_id] = progress
+                while len(self._learners) > self.max_learners:
+                    self._learners.popitem(last=False)
+        return progress
+
+    def get(self, learner_id):
+        """Return {lesson: completed} for a learner"""
+        progress = self._progress(learner_id)
+        with self._lock:
+            return dict(progress.lessons)
+
+    def exercises(self, learner_id):
+        """Return {exercise: (attempts, passed)} for a learner"""
+        progress = self._progress(learner_id)
+        with self._lock:
+            return {exercise: (attempts, passed) for exercise, (attempts, passed, _) in progress.exercises.items()}
+
+    def rollups(self):
+        """Return the cohort's CohortRollups, as of the last compaction"""
+        return self.store.rollups()
+
+    def record(self, learner_id, kind, lesson=None, exercise=None):
+        """Log a progress event; it is written to disk in the background"""
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Unknown progress event: {kind!r}")
+        event = ProgressEvent(learner_id, kind, lesson, exercise, time.time())
+        with self._lock:
+            self._pending.append(event)
+            progress = self._learners.get(learner_id)
+            if progress is not None:
+                apply_event(progress, event)
+            full = len(self._pending) >= self.max_rows
+        if full:
+            self._wake.set()
+
+    def set(self, learner_id, lesson, completed):
+        self.record(learner_id, EVENT_COMPLETE if completed else EVENT_RESET, lesson)
+
+    def set_many(self, learner_id, lessons):
+        for lesson, completed in lessons.items():
+            self.set(learner_id, lesson, completed)
+
+    def flush(self):
+        """Write all buffered events now"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = self._pending, []
+            shards = {}
+            for event in events:
+                shards.setdefault(self.store.shard_for(event.learner_id), []).append(event)
+            failed = []
+            for shard, shard_events in shards.items():
+                try:
+                    shard.append(shard_events)
+                except sqlite3.Error as e:
+                    print(f"Could not save progress, retrying: {e}", file=sys.stderr)
+                    failed.extend(shard_events)
+            if failed:
+                # Ahead of newer events, so they keep their order
+                with self._lock:
+                    self._pending[:0] = failed
+
+    def _flush_forever(self):
+        last_compacted = time.monotonic()
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - last_compacted >= self.compact_interval:
+                last_compacted = time.monotonic()
+                try:
+                    self.store.compact()
+                except sqlite3.Error as e:
+                    print(f"Could not compact the progress log: {e}", file=sys.stderr)
+
+    def close(self):
+        """Stop the background thread and write what is still buffered"""
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_progress_store():
+    """Return the process-wide progress writer, migrating the old JSON file on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = ShardedProgressStore()
+                store.migrate_json()
+                _store = ProgressWriter(store)
+                atexit.register(_store.close)
+    return _store
+
+
+def _json_writer(path):
+    """The old way of saving: one shared dict, rewritten in full on every change"""
+    progress = {}
+    lock = threading.Lock()
+
+    def write(learner_id, lesson, completed):
+        with lock:
+            progress[f"{learner_id}/{lesson}"] = completed
+            with open(path, "w") as f:
+                json.dump(progress, f)
+    return write
+
+
+def benchmark(write, sessions, writes):
+    """Call write() from `sessions` threads at once and return (writes per second, p50, p99 latency)"""
+    latencies = []
+    latencies_lock = threading.Lock()
+    start = threading.Barrier(sessions)
+
+    def session(number):
+        timings = []
+        start.wait()
+        for i in range(writes):
+            began = time.perf_counter()
+            write(f"learner-{number}", f"Lesson {i % 9}", i % 2)
+            timings.append(time.perf_counter() - began)
+        with latencies_lock:
+            latencies.extend(timings)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Learner progress store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="import a user_progress.json file")
+    migrate.add_argument("json_path", nargs="?", default=str(LEGACY_PROGRESS_PATH))
+    migrate.add_argument("--learner", default=DEFAULT_LEARNER)
+    commands.add_parser("compact", help="fold the event log into the snapshot now")
+    bench = commands.add_parser("benchmark", help="measure write throughput with concurrent sessions")
+    bench.add_argument("--sessions", type=int, default=300)
+    bench.add_argument("--writes", type=int, default=50, help="writes per session")
+    bench.add_argument("--shards", type=int, default=PROGRESS_SHARDS)
+    bench.add_argument("--json-baseline", action="store_true", help="also time rewriting a JSON file per change")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        count = ShardedProgressStore().migrate_json(args.json_path, args.learner)
+        print(f"Imported {count} lessons from {args.json_path}")
+        return 0
+    if args.command == "compact":
+        print(f"Compacted {ShardedProgressStore().compact()} events")
+        return 0
+    with tempfile.TemporaryDirectory() as directory:
+        store = ShardedProgressStore(Path(directory) / "benchmark.db", args.shards)
+        writer = ProgressWriter(ShardedProgressStore(Path(directory) / "buffered.db", args.shards))
+        writers = [(f"sqlite, {args.shards} shards", store.set), ("write-behind", writer.set)]
+        if args.json_baseline:
+            writers.append(("json", _json_writer(Path(directory) / "benchmark.json")))
+        for name, write in writers:
+            rate, p50, p99 = benchmark(write, args.sessions, args.writes)
+            print(
+                f"{name}: {args.sessions} sessions x {args.writes} writes: {rate:,.0f} writes/s, "
+                f"latency p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms"
+            )
+            if write == writer.set:
+                began = time.perf_counter()
+                writer.close()
+                print(f"write-behind: buffered changes saved in {time.perf_counter() - began:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
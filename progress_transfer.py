@@ -0,0 +1,157 @@
+"""Export and import learner progress in bulk.
+
+    python progress_transfer.py export progress.ndjson
+    python progress_transfer.py import progress.csv [--chunk-rows N]
+
+Records are JSON Lines (NDJSON) or, for files ending in .csv or with
+--format csv, CSV with a header row. Every record has the fields of
+progress_store.RECORD_FIELDS: a lesson's "completed" when "exercise" is
+empty, otherwise an exercise's "attempts" and "passed". "-" reads stdin or
+writes stdout.
+
+Both directions stream: rows are read and written `--chunk-rows` at a
+time, so memory stays flat however many learners there are. Importing
+upserts, keeping whichever of the stored and imported row was updated
+last, so a file can be imported again, or after an interrupted run,
+without changing the result. A running app keeps the progress of recent
+learners in memory and only sees imported rows of other learners, so
+import into a stopped app. Throughput is reported on stderr.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from progress_store import RECORD_FIELDS, ShardedProgressStore
+from throughput import PROGRESS_INTERVAL, Throughput
+
+# Records read or written per batch
+CHUNK_ROWS = 10000
+
+
+class Transfer(Throughput):
+    """Counts transferred records and reports the rate"""
+
+    def __init__(self, verb, stream=sys.stderr, interval=PROGRESS_INTERVAL):
+        super().__init__(verb, "records", stream, interval)
+        self.invalid = 0
+
+    def details(self):
+        return f"{self.invalid} invalid records skipped" if self.invalid else None
+
+
+def file_format(path, requested=None):
+    if requested:
+        return requested
+    return "csv" if str(path).lower().endswith(".csv") else "ndjson"
+
+
+def _open(path, mode):
+    if path == "-":
+        return open((sys.stdin if "r" in mode else sys.stdout).fileno(), mode, newline="", closefd=False)
+    return open(path, mode, newline="")
+
+
+def _optional(value, convert):
+    return None if value is None or value == "" else convert(value)
+
+
+def parse_record(fields):
+    """Turn a record read from a file into a tuple of RECORD_FIELDS; raises ValueError if it is invalid"""
+    learner_id = fields.get("learner_id")
+    if not learner_id:
+        raise ValueError("missing learner_id")
+    lesson = _optional(fields.get("lesson"), str)
+    exercise = _optional(fields.get("exercise"), str)
+    updated_at = _optional(fields.get("updated_at"), float)
+    if updated_at is None:
+        updated_at = time.time()
+    if exercise is None:
+        if lesson is None:
+            raise ValueError("a record needs a lesson or an exercise")
+        return (str(learner_id), lesson, None, int(_optional(fields.get("completed"), int) or 0), None, None, updated_at)
+    attempts = int(_optional(fields.get("attempts"), int) or 0)
+    passed = int(_optional(fields.get("passed"), int) or 0)
+    return (str(learner_id), lesson, exercise, None, attempts, passed, updated_at)
+
+
+def read_records(f, fmt, throughput):
+    """Yield the valid records of an NDJSON or CSV file, reporting invalid ones on stderr"""
+    lines = csv.DictReader(f) if fmt == "csv" else (line for line in f if line.strip())
+    for number, line in enumerate(lines, 1):
+        try:
+            fields = line if fmt == "csv" else json.loads(line)
+            if not isinstance(fields, dict):
+                raise ValueError("not an object")
+            yield parse_record(fields)
+        except (ValueError, TypeError) as e:
+            throughput.invalid += 1
+            print(f"Record {number}: {e}", file=sys.stderr)
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_progress(store, path, fmt=None, chunk_rows=CHUNK_ROWS):
+    """Upsert every record of a file into the store, one transaction per shard and chunk"""
+    throughput = Transfer("Imported")
+    with _open(path, "r") as f:
+        for chunk in _chunks(read_records(f, file_format(path, fmt), throughput), chunk_rows):
+            shards = {}
+            for record in chunk:
+                shards.setdefault(store.shard_for(record[0]), []).append(record)
+            for shard, records in shards.items():
+                shard.import_records(records)
+            throughput.add(len(chunk))
+    throughput.report(final=True)
+    return throughput
+
+
+def export_progress(store, path, fmt=None, chunk_rows=CHUNK_ROWS):
+    """Write every learner's progress in the store to a file"""
+    throughput = Transfer("Exported")
+    # Fold logged events into the snapshot, which is what gets exported
+    store.compact()
+    fmt = file_format(path, fmt)
+    with _open(path, "w") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(RECORD_FIELDS)
+        for shard in store.shards:
+            for chunk in _chunks(shard.records(chunk_rows), chunk_rows):
+                if writer:
+                    writer.writerows(chunk)
+                else:
+                    f.write("".join(json.dumps(dict(zip(RECORD_FIELDS, record))) + "\n" for record in chunk))
+                throughput.add(len(chunk))
+    throughput.report(final=True)
+    return throughput
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import learner progress.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help='NDJSON or CSV file, "-" for stdin/stdout')
+    parser.add_argument("--format", choices=["ndjson", "csv"], default=None,
+                        help="file format (default: from the file extension)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+    store = ShardedProgressStore()
+    if args.command == "export":
+        export_progress(store, args.path, args.format, args.chunk_rows)
+        return 0
+    throughput = import_progress(store, args.path, args.format, args.chunk_rows)
+    return 1 if throughput.invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
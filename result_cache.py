@@ -0,0 +1,155 @@
+"""Content-addressed cache of execution results.
+
+Lesson pages run the same default snippets for every student. Results of
+deterministic code are cached under a hash of the normalized source, the
+interpreter version and the versions of the data-science libraries, so an
+unmodified sample only has to run once per server process. Code that reads
+the clock, unseeded random numbers, files, the network or user input is
+never cached.
+"""
+import ast
+import hashlib
+import platform
+import threading
+from collections import OrderedDict
+from importlib import metadata
+
+import dataset_registry
+
+# Distributions whose version changes what a snippet prints or draws
+VERSIONED_PACKAGES = ["numpy", "pandas", "matplotlib", "seaborn", "scipy"]
+
+# Importing any of these makes the output depend on more than the source
+UNCACHEABLE_MODULES = {
+    "datetime", "glob", "multiprocessing", "os", "pathlib", "secrets",
+    "shutil", "socket", "subprocess", "sys", "tempfile", "threading", "time",
+    "urllib", "uuid",
+}
+UNCACHEABLE_BUILTINS = {"open", "input", "id", "exec", "eval", "__import__"}
+UNCACHEABLE_ATTRIBUTES = {"now", "today", "utcnow"}
+
+
+def normalize_source(code_str):
+    """Normalize line endings and trailing whitespace, which never change behaviour"""
+    lines = code_str.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def is_cacheable(code_str, random_pinned=False):
+    """Return True if the code's result depends only on its source
+
+    With `random_pinned` the run's random generators start from a fixed
+    seed, so random numbers don't make it uncacheable.
+    """
+    try:
+        tree = ast.parse(code_str)
+    except SyntaxError:
+        # A syntax error is as deterministic as it gets
+        return True
+    uses_random = False
+    seeded = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""]
+        else:
+            modules = []
+        for module in modules:
+            parts = module.split(".")
+            if parts[0] in UNCACHEABLE_MODULES:
+                return False
+            if "random" in parts:
+                uses_random = True
+        if isinstance(node, ast.Name) and node.id in UNCACHEABLE_BUILTINS:
+            return False
+        if isinstance(node, ast.Attribute):
+            if node.attr in UNCACHEABLE_ATTRIBUTES:
+                return False
+            if node.attr == "random":
+                uses_random = True
+            elif node.attr == "seed":
+                seeded = True
+        if isinstance(node, ast.Call) and getattr(node.func, "attr", None) == "default_rng":
+            # default_rng() without a seed draws entropy from the OS
+            uses_random = True
+            seeded = seeded or bool(node.args or node.keywords)
+    return random_pinned or seeded or not uses_random
+
+
+_environment = None
+
+
+def environment_fingerprint():
+    """Interpreter and library versions that are part of every cache key"""
+    global _environment
+    if _environment is None:
+        parts = [platform.python_implementation(), platform.python_version()]
+        for package in VERSIONED_PACKAGES:
+            try:
+                parts.append(f"{package}={metadata.version(package)}")
+            except metadata.PackageNotFoundError:
+                parts.append(f"{package}=missing")
+        # Snippets may read the shared datasets, which change with their version
+        parts.append(dataset_registry.fingerprint())
+        _environment = ";".join(parts)
+    return _environment
+
+
+def cache_key(code_str, *extra):
+    """Hash of the normalized source, the environment and any extra parameters"""
+    digest = hashlib.sha256()
+    digest.update(environment_fingerprint().encode())
+    for part in extra:
+        digest.update(b"\0" + repr(part).encode())
+    digest.update(b"\0" + normalize_source(code_str).encode())
+    return digest.hexdigest()
+
+
+def _result_size(result):
+    """Approximate memory held by a cached result, in bytes"""
+    size = sum(len(value) for value in result if isinstance(value, (str, bytes)))
+    return size + sum(len(data) for _, data in getattr(result, "figures", ()))
+
+
+class ResultCache:
+    """Thread-safe LRU of execution results bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result):
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
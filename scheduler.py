@@ -0,0 +1,154 @@
+"""Fair-share admission control in front of the execution backend.
+
+When a classroom presses Run Code at the same moment, runs wait here for
+one of the `slots` execution slots instead of piling onto the workers:
+
+- each session may have at most `per_session` runs executing and
+  `max_queued` runs waiting; further runs are rejected straight away.
+  A caller may set other limits for its own sessions (grading does)
+- waiting runs are served round-robin across sessions, so one session
+  cannot starve the others
+- PRIORITY_HIGH runs (unmodified lesson snippets) go before
+  PRIORITY_NORMAL runs (learner submissions)
+
+`metrics()` reports queue depth, running runs and recent wait times.
+"""
+import contextlib
+import threading
+import time
+from collections import OrderedDict, deque
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL)
+
+
+class QueueFull(Exception):
+    """The session already has too many runs waiting"""
+
+
+class _Ticket:
+    def __init__(self, session_id, priority, per_session):
+        self.session_id = session_id
+        self.priority = priority
+        self.per_session = per_session
+        self.enqueued = time.monotonic()
+
+
+class Scheduler:
+    """Grants execution slots fairly across sessions"""
+
+    def __init__(self, slots, per_session=1, max_queued=3, history=1000):
+        self.slots = slots
+        self.per_session = per_session
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._running = 0
+        self._running_by_session = {}
+        # priority -> session id -> waiting tickets; sessions rotate to the end once served
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._waits = deque(maxlen=history)
+        self.admitted = 0
+        self.rejected = 0
+
+    def _service_order(self):
+        """Waiting tickets in the order they would be served"""
+        order = []
+        for priority in PRIORITIES:
+            sessions = [list(tickets) for tickets in self._queues[priority].values()]
+            depth = 0
+            while sessions:
+                sessions = [tickets for tickets in sessions if len(tickets) > depth]
+                order.extend(tickets[depth] for tickets in sessions)
+                depth += 1
+        return order
+
+    def _next_ticket(self):
+        """The ticket to admit next, skipping sessions at their concurrency limit"""
+        for priority in PRIORITIES:
+            for session_id, tickets in self._queues[priority].items():
+                if self._running_by_session.get(session_id, 0) < tickets[0].per_session:
+                    return tickets[0]
+        return None
+
+    def _dequeue(self, ticket):
+        sessions = self._queues[ticket.priority]
+        tickets = sessions.pop(ticket.session_id)
+        tickets.remove(ticket)
+        if tickets:
+            # Re-inserting puts the session at the back of the rotation
+            sessions[ticket.session_id] = tickets
+
+    def acquire(self, session_id, priority=PRIORITY_NORMAL, on_position=None, per_session=None, max_queued=None):
+        """Wait for an execution slot; raises QueueFull if the session has too many waiting
+
+        `per_session` and `max_queued` override the scheduler's limits for this session.
+        """
+        with self._cond:
+            waiting = sum(len(queues.get(session_id, ())) for queues in self._queues.values())
+            if waiting >= (self.max_queued if max_queued is None else max_queued):
+                self.rejected += 1
+                raise QueueFull()
+            ticket = _Ticket(session_id, priority, self.per_session if per_session is None else per_session)
+            self._queues[priority].setdefault(session_id, deque()).append(ticket)
+            try:
+                self._wait_for_turn(ticket, on_position)
+            finally:
+                # Leaves the queue both when admitted and when the wait is interrupted
+                self._dequeue(ticket)
+            self._running += 1
+            self._running_by_session[session_id] = self._running_by_session.get(session_id, 0) + 1
+            self._waits.append(time.monotonic() - ticket.enqueued)
+            self.admitted += 1
+
+    def _wait_for_turn(self, ticket, on_position):
+        last_position = None
+        while not (self._running < self.slots and self._next_ticket() is ticket):
+            if on_position is not None:
+                position = self._service_order().index(ticket) + 1
+                if position != last_position:
+                    last_position = position
+                    # Don't call back into the UI while holding the lock
+                    self._cond.release()
+                    try:
+                        on_position(position)
+                    finally:
+                        self._cond.acquire()
+                    continue
+            self._cond.wait(0.5)
+
+    def release(self, session_id):
+        with self._cond:
+            self._running -= 1
+            count = self._running_by_session[session_id] - 1
+            if count:
+                self._running_by_session[session_id] = count
+            else:
+                del self._running_by_session[session_id]
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, session_id, priority=PRIORITY_NORMAL, on_position=None, per_session=None, max_queued=None):
+        """Context manager holding an execution slot"""
+        self.acquire(session_id, priority, on_position, per_session, max_queued)
+        try:
+            yield
+        finally:
+            self.release(session_id)
+
+    def metrics(self):
+        """Queue depth, running runs and wait times (seconds) of recent runs"""
+        with self._cond:
+            waits = sorted(self._waits)
+            depth = sum(len(tickets) for queues in self._queues.values() for tickets in queues.values())
+            return {
+                "queue_depth": depth,
+                "running": self._running,
+                "slots": self.slots,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "wait_max": waits[-1] if waits else 0.0,
+            }
+
@@ -0,0 +1,117 @@
+"""Structural requirements of exercise submissions, checked on the AST.
+
+An exercise can declare what a solution must contain, for example
+
+    requires=["def get_unique_even_numbers", "try", "except KeyError", "call resample"]
+
+Submissions that miss a requirement are rejected with a targeted message
+before anything is sent to the executor. Each requirement is a keyword,
+optionally followed by a name:
+
+- "def NAME", "class NAME": defines a function or class with that name
+- "call NAME": calls NAME, as a function or a method
+- "import NAME": imports the module NAME (or something from it)
+- "except NAME": handles the exception NAME (a bare `except:` or
+  `except Exception:` counts too)
+- "for", "while", "if", "try", "with", "continue", "break", "return": uses
+  that statement
+"""
+import ast
+
+STATEMENT_TYPES = {
+    "for": (ast.For, ast.AsyncFor),
+    "while": (ast.While,),
+    "if": (ast.If, ast.IfExp),
+    "try": (ast.Try,) + ((ast.TryStar,) if hasattr(ast, "TryStar") else ()),
+    "with": (ast.With, ast.AsyncWith),
+    "continue": (ast.Continue,),
+    "break": (ast.Break,),
+    "return": (ast.Return,),
+}
+
+_STATEMENT_KINDS = {node_type: kind for kind, types in STATEMENT_TYPES.items() for node_type in types}
+
+REQUIREMENT_MESSAGES = {
+    "def": "Your code needs to define a function called `{name}`.",
+    "class": "Your code needs to define a class called `{name}`.",
+    "call": "Your code needs to call `{name}`.",
+    "import": "Your code needs to import `{name}`.",
+    "except": "Your code needs to handle `{name}` with an `except` block.",
+    "for": "Your code needs a `for` loop.",
+    "while": "Your code needs a `while` loop.",
+    "if": "Your code needs an `if` statement.",
+    "try": "Your code needs a `try`/`except` block.",
+    "with": "Your code needs a `with` statement.",
+    "continue": "Your code needs a `continue` statement.",
+    "break": "Your code needs a `break` statement.",
+    "return": "Your code needs a `return` statement.",
+}
+
+# Handlers that catch whatever exception a requirement names
+CATCH_ALL = {None, "Exception", "BaseException"}
+
+
+def _name(node):
+    """Last component of a Name or Attribute node"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _features(tree):
+    """Set of (kind, name) pairs describing what the code contains"""
+    found = set()
+    for node in ast.walk(tree):
+        kind = _STATEMENT_KINDS.get(type(node))
+        if kind is not None:
+            found.add((kind, None))
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            found.add(("def", node.name))
+        elif isinstance(node, ast.ClassDef):
+            found.add(("class", node.name))
+        elif isinstance(node, ast.Call):
+            found.add(("call", _name(node.func)))
+        elif isinstance(node, ast.Import):
+            found.update(("import", alias.name) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            found.add(("import", node.module))
+        elif isinstance(node, ast.ExceptHandler):
+            types = node.type.elts if isinstance(node.type, ast.Tuple) else [node.type]
+            found.update(("except", _name(handled) if handled is not None else None) for handled in types)
+    return found
+
+
+def _satisfied(kind, name, features):
+    if kind == "import":
+        # "import numpy" is satisfied by "import numpy.random" and "from numpy import x"
+        return any(k == "import" and (n == name or n.startswith(name + ".")) for k, n in features)
+    if kind == "except":
+        return any(("except", handled) in features for handled in CATCH_ALL | {name})
+    return (kind, name) in features
+
+
+def check_requirements(code_str, requirements):
+    """Return a message for every requirement the code does not meet
+
+    Code that doesn't parse passes; its syntax error is reported when it is
+    compiled for running, which also never reaches a worker.
+    """
+    if not requirements:
+        return []
+    parsed = []
+    for requirement in requirements:
+        kind, _, name = requirement.partition(" ")
+        if kind not in REQUIREMENT_MESSAGES or (kind in STATEMENT_TYPES) == bool(name):
+            raise ValueError(f"Unknown exercise requirement: {requirement!r}")
+        parsed.append((kind, name.strip() or None))
+    try:
+        features = _features(ast.parse(code_str))
+    except (SyntaxError, ValueError):
+        return []
+    return [
+        REQUIREMENT_MESSAGES[kind].format(name=name)
+        for kind, name in parsed
+        if not _satisfied(kind, name, features)
+    ]
@@ -0,0 +1,70 @@
+"""Check that concurrent runs never see each other's output.
+
+    python stress_output.py [--runs 300] [--threads 150]
+
+Runs learner-style snippets with the inline backend, which shares
+sys.stdout and sys.stderr between all threads of the process, so every
+run's output goes through executor.capture_output's context-local
+routing. Each snippet prints numbered lines to stdout and stderr with
+short sleeps in between, so that runs interleave. The check fails if any
+run captured a line that isn't its own, or missed one of its own lines.
+"""
+import argparse
+import concurrent.futures
+import sys
+import time
+
+from executor import InlineBackend
+
+# Lines each run prints to stdout and to stderr
+LINES_PER_RUN = 20
+
+SNIPPET = """
+import sys, time
+for i in range({lines}):
+    print("run {run} out", i)
+    print("run {run} err", i, file=sys.stderr)
+    time.sleep(0.001)
+"""
+
+
+def expected_lines(run, stream):
+    return [f"run {run} {stream} {i}" for i in range(LINES_PER_RUN)]
+
+
+def check_run(backend, run):
+    """Run one snippet and return a list of problems with its captured output"""
+    result = backend.run(SNIPPET.format(lines=LINES_PER_RUN, run=run))
+    problems = []
+    if result.exception:
+        problems.append(f"run {run}: {result.exception}")
+    for stream, text in (("out", result.output), ("err", result.error)):
+        if text.splitlines() != expected_lines(run, stream):
+            problems.append(f"run {run}: unexpected {stream} lines: {text.splitlines()[:3]}...")
+    return problems
+
+
+def stress(runs, threads):
+    """Run `runs` snippets on `threads` threads; return (problems, seconds)"""
+    backend = InlineBackend()
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda run: check_run(backend, run), range(runs)))
+    return [problem for problems in results for problem in problems], time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check output isolation of concurrent runs.")
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=150)
+    args = parser.parse_args(argv)
+    problems, seconds = stress(args.runs, args.threads)
+    for problem in problems[:20]:
+        print(problem, file=sys.stderr)
+    status = "FAILED" if problems else "OK"
+    print(f"{status}: {args.runs} runs on {args.threads} threads in {seconds:.1f} s, {len(problems)} problems")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""Throughput reporting for the command line tools.
+
+Long runs print a progress line on stderr every PROGRESS_INTERVAL seconds
+and a final one when they are done.
+"""
+import sys
+import time
+
+# Seconds between progress lines on stderr
+PROGRESS_INTERVAL = 5.0
+
+
+class Throughput:
+    """Counts processed items and reports the rate"""
+
+    def __init__(self, verb, unit, stream=sys.stderr, interval=PROGRESS_INTERVAL):
+        self.verb = verb
+        self.unit = unit
+        self.stream = stream
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self.count = 0
+
+    def add(self, count=1):
+        self.count += count
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def details(self):
+        """Other counts, shown in parentheses after the total"""
+        return None
+
+    def report(self, final=False):
+        elapsed = time.monotonic() - self.started
+        label = self.verb if final else f"{self.verb} so far:"
+        details = self.details()
+        details = f" ({details})" if details else ""
+        print(
+            f"{label} {self.count} {self.unit}{details} in {elapsed:.1f} s, {self.rate():,.1f} {self.unit}/s",
+            file=self.stream,
+        )
@@ -1,19 +1,24 @@
 import streamlit as st
-import sys
-from io import StringIO
-import contextlib
+import pandas as pd
+import re
+import secrets
+import time
+import uuid
+from executor import OutputRingBuffer, capture_output, get_kernels, run_code
+from scheduler import PRIORITY_HIGH, PRIORITY_NORMAL
+from grading import Verdict, exercise_hash, exercise_id, exercise_requirements, grade_submission
+from static_checks import check_requirements
+from progress_store import EVENT_ATTEMPT, EVENT_COMPLETE, EVENT_PASS, EVENT_RESET, get_progress_store
 
 def mark_lesson_complete(lesson_name):
     """Mark a lesson as complete in the session state and save progress"""
     # Initialize session state if not already done
     if "completed_lessons" not in st.session_state:
-        st.session_state.completed_lessons = {}
+        st.session_state.completed_lessons = get_progress_store().get(get_learner_id())
     
     st.session_state.completed_lessons[lesson_name] = 1
-    # Save to file
-    import json
-    with open("user_progress.json", "w") as f:
-        json.dump(st.session_state.completed_lessons, f)
+    # Saved by a background thread shortly after, see progress_store.ProgressWriter
+    get_progress_store().record(get_learner_id(), EVENT_COMPLETE, lesson_name)
     
     st.success(f"🎉 Congratulations! You've completed the {lesson_name} lesson!")
 
@@ -21,42 +26,118 @@ def check_completion_status(lesson_name):
     """Check if a lesson is marked as complete"""
     # Initialize session state if not already done
     if "completed_lessons" not in st.session_state:
-        st.session_state.completed_lessons = {}
+        st.session_state.completed_lessons = get_progress_store().get(get_learner_id())
     return st.session_state.completed_lessons.get(lesson_name, 0) == 1
 
 def reset_lesson_progress(lesson_name):
     """Reset the progress for a specific lesson"""
     # Initialize session state if not already done
     if "completed_lessons" not in st.session_state:
-        st.session_state.completed_lessons = {}
+        st.session_state.completed_lessons = get_progress_store().get(get_learner_id())
         
     if lesson_name in st.session_state.completed_lessons:
         st.session_state.completed_lessons[lesson_name] = 0
-        # Save to file
-        import json
-        with open("user_progress.json", "w") as f:
-            json.dump(st.session_state.completed_lessons, f)
+        # Saved by a background thread shortly after, see progress_store.ProgressWriter
+        get_progress_store().record(get_learner_id(), EVENT_RESET, lesson_name)
         st.success(f"Progress for {lesson_name} has been reset.")
 
-@contextlib.contextmanager
-def capture_output():
-    """Capture stdout and stderr for code execution"""
-    old_stdout, old_stderr = sys.stdout, sys.stderr
-    new_stdout, new_stderr = StringIO(), StringIO()
-    sys.stdout, sys.stderr = new_stdout, new_stderr
-    yield new_stdout, new_stderr
-    sys.stdout, sys.stderr = old_stdout, old_stderr
+# Output longer than this is cut in the page, with the rest behind "Show more"
+OUTPUT_DISPLAY_CHARS = 20000
 
-def execute_code(code_str):
+# Query parameter carrying the learner's anonymous id, e.g. ?learner=3q2x...
+LEARNER_PARAM = "learner"
+LEARNER_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def get_learner_id():
+    """Return the anonymous id progress is saved under
+
+    The id comes from the page URL, so a bookmarked link brings the learner
+    back to their progress. Visitors without one get a new random id.
+    """
+    if "learner_id" not in st.session_state:
+        learner_id = st.query_params.get(LEARNER_PARAM, "")
+        if not LEARNER_ID_PATTERN.fullmatch(learner_id):
+            learner_id = secrets.token_urlsafe(12)
+        st.session_state.learner_id = learner_id
+    # Switching pages drops the query string, so put the id back
+    if st.query_params.get(LEARNER_PARAM) != st.session_state.learner_id:
+        st.query_params[LEARNER_PARAM] = st.session_state.learner_id
+    return st.session_state.learner_id
+
+def get_session_id():
+    """Return a stable id for the current browser session"""
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+def execute_code(code_str, limits=None, on_output=None, priority=PRIORITY_NORMAL, on_queue=None, kernel=False):
     """Execute the provided code and return the output"""
-    with capture_output() as (out, err):
-        try:
-            exec(code_str)
-            output = out.getvalue()
-            error = err.getvalue()
-            return output, error, None
-        except Exception as e:
-            return out.getvalue(), err.getvalue(), str(e)
+    result = execute_code_result(code_str, limits, on_output, priority, on_queue, kernel)
+    return result.output, result.error, result.exception
+
+def execute_code_result(code_str, limits=None, on_output=None, priority=PRIORITY_NORMAL, on_queue=None, kernel=False):
+    """Execute the provided code and return the full ExecutionResult, figures included"""
+    # Runs on the configured backend (warm worker pool by default, see executor.py)
+    return run_code(
+        code_str,
+        limits,
+        on_output=on_output,
+        session_id=get_session_id(),
+        priority=priority,
+        on_queue=on_queue,
+        kernel=kernel,
+    )
+
+def show_queue_position(placeholder):
+    """Return an on_queue callback that shows the run's place in the queue"""
+    def on_queue(position):
+        placeholder.info(f"⏳ Waiting for a free runner... you are number {position} in the queue.")
+    return on_queue
+
+class LiveOutput:
+    """Show the tail of a run's output while it is still running"""
+
+    def __init__(self, placeholder, interval=0.25, max_chars=4000):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.buffer = OutputRingBuffer(max_chars)
+        self._last_render = 0.0
+
+    def __call__(self, stream, text):
+        self.buffer.write(text)
+        # Throttle UI updates; every update is a message to the browser
+        now = time.monotonic()
+        if now - self._last_render >= self.interval:
+            self._last_render = now
+            self.placeholder.code(self.buffer.getvalue(), language="")
+
+def show_output(output):
+    """Display program output, truncating very long output behind a 'Show more' expander"""
+    if len(output) <= OUTPUT_DISPLAY_CHARS:
+        st.code(output, language="")
+        return
+    st.code(output[:OUTPUT_DISPLAY_CHARS], language="")
+    with st.expander(f"Show more ({len(output) - OUTPUT_DISPLAY_CHARS} more characters)"):
+        st.code(output[OUTPUT_DISPLAY_CHARS:], language="")
+
+def show_figures(figures):
+    """Display figures rendered by the executor"""
+    for image_format, data in figures:
+        if image_format == "svg":
+            st.image(data.decode("utf-8"))
+        else:
+            st.image(data)
+
+def show_code_figures(code_str):
+    """Display the figures drawn by a lesson snippet
+
+    The snippet runs in a worker and its result is cached, so the plots are
+    drawn once per server rather than on every rerun of the page.
+    """
+    result = run_code(code_str, priority=PRIORITY_HIGH)
+    if result.exception or result.limit_exceeded:
+        st.error(f"Could not draw this example: {result.exception}")
+    show_figures(result.figures)
 
 def create_code_executor(default_code=""):
     """Create an interactive code editor with execution capability"""
@@ -67,7 +148,18 @@ def create_code_executor(default_code=""):
     code = st.text_area("Code Editor", value=default_code, height=200, key=f"editor_{unique_id}")
     
     if st.button("Run Code", key=f"run_{unique_id}"):
-        output, error, exception = execute_code(code)
+        live = st.empty()
+        # Unmodified lesson snippets are short and usually cached, so they go first
+        priority = PRIORITY_HIGH if code == default_code else PRIORITY_NORMAL
+        result = execute_code_result(
+            code,
+            on_output=LiveOutput(live),
+            priority=priority,
+            on_queue=show_queue_position(live),
+            kernel=st.session_state.get("kernel_mode", False),
+        )
+        live.empty()
+        output, error, exception = result.output, result.error, result.exception
         
         if exception:
             st.error(f"Exception: {exception}")
@@ -76,17 +168,108 @@ def create_code_executor(default_code=""):
             st.error(f"Error: {error}")
         
         if output:
-            st.code(output, language="")
+            show_output(output)
+        
+        show_figures(result.figures)
             
         return code, output, error, exception
     
     return code, None, None, None
 
-def create_exercise(exercise_prompt, solution_code, test_func=None):
-    """Create an interactive exercise with validation"""
+def show_case_report(function_name, report):
+    """Display the per-case results of a check graded with test cases"""
+    for case in report.cases:
+        call = f"{function_name}({', '.join(repr(arg) for arg in case.args)})"
+        if case.passed:
+            st.markdown(f"✅ `{call}` returned `{case.actual}` ({case.seconds:.2f} s)")
+            continue
+        if case.exception:
+            st.error(f"❌ `{call}` failed: {case.exception}")
+        else:
+            st.error(f"❌ `{call}` returned `{case.actual}`, expected `{case.expected}`")
+            if case.diff:
+                st.caption(case.diff)
+        if case.output.strip():
+            show_output(case.output)
+    if report.message:
+        st.warning(report.message)
+    if report.skipped:
+        st.caption(f"{report.skipped} more test cases were not run.")
+
+def show_verdict(function_name, verdict):
+    """Display the outcome of an exercise check"""
+    if verdict.problems:
+        for problem in verdict.problems:
+            st.error(f"❌ {problem}")
+        return
+    if verdict.report is not None:
+        show_case_report(function_name, verdict.report)
+        correct = verdict.report.passed
+    else:
+        show_figures(verdict.figures)
+        if verdict.exception or verdict.error:
+            st.error("Your code has errors. Please fix them and try again.")
+            if verdict.exception:
+                st.error(f"Exception: {verdict.exception}")
+            if verdict.error:
+                st.error(f"Error: {verdict.error}")
+            return
+        correct = verdict.diff is None
+    if verdict.complexity is not None:
+        show_complexity(verdict.complexity)
+    if verdict.passed:
+        st.success("✅ Correct! Great job!")
+    elif correct:
+        st.error("❌ Your solution gives the right answers, but it gets slow too quickly on large inputs. Try a faster approach!")
+    elif verdict.report is not None:
+        st.error("❌ Your solution doesn't pass all the test cases. Try again!")
+    else:
+        st.error("❌ Your solution doesn't match the expected output. Try again!")
+        if verdict.diff:
+            st.code(verdict.diff, language="")
+
+def show_complexity(complexity):
+    """Chart how a submission's running time grows, next to the reference solution"""
+    chart = pd.DataFrame({
+        "Your solution": pd.Series(complexity.seconds, index=complexity.sizes, dtype=float),
+        "Reference solution": pd.Series(complexity.reference_seconds, index=complexity.reference_sizes, dtype=float),
+    })
+    chart.index.name = "Input size"
+    st.markdown("**Seconds per call by input size**")
+    st.line_chart(chart)
+    if complexity.exponent is None:
+        st.warning("Your function was too slow to time at enough input sizes.")
+        return
+    details = [f"allowed: up to n^{complexity.max_exponent:g}"]
+    if complexity.reference_exponent is not None:
+        details.insert(0, f"reference solution: n^{complexity.reference_exponent:.2f}")
+    growth = f"Your running time grows like n^{complexity.exponent:.2f} ({', '.join(details)})."
+    if complexity.within_bound:
+        st.caption(growth)
+    else:
+        st.warning(growth)
+
+def create_exercise(exercise_prompt, solution_code, test_func=None, function_name=None, test_cases=None, requires=None,
+                    benchmark=None):
+    """Create an interactive exercise with validation
+
+    With `function_name` and `test_cases` (tuples of arguments) the learner's
+    function is called with every case and compared with the solution's.
+    `requires` lists structural requirements checked before the code runs
+    (see static_checks.py), and `benchmark` times correct solutions at
+    growing input sizes (see complexity.py).
+
+    Returns True once the exercise has been passed in this session, also on
+    later reruns, until the exercise itself is changed.
+    """
     # Create a unique ID for this exercise based on the prompt
-    import hashlib
-    unique_id = hashlib.md5(exercise_prompt.encode()).hexdigest()[:8]
+    unique_id = exercise_id(exercise_prompt)
+    definition = exercise_hash(
+        exercise_prompt, solution_code, function_name, test_cases or (), requires or (), benchmark, test_func,
+    )
+    # Exercise id -> hash of the definition that was passed
+    passed_exercises = st.session_state.setdefault("passed_exercises", {})
+    already_passed = passed_exercises.get(unique_id) == definition
     
     st.markdown(f"### Exercise: {exercise_prompt}")
     
@@ -95,38 +278,66 @@ def create_exercise(exercise_prompt, solution_code, test_func=None):
     if st.button("Check Solution", key=f"check_{unique_id}"):
         if not user_code.strip():
             st.warning("Please write some code before checking.")
-            return False
-        
-        output, error, exception = execute_code(user_code)
-        
-        if exception or error:
-            st.error("Your code has errors. Please fix them and try again.")
-            if exception:
-                st.error(f"Exception: {exception}")
-            if error:
-                st.error(f"Error: {error}")
-            return False
+            return already_passed
         
-        if test_func:
-            # Use a custom testing function if provided
-            is_correct = test_func(user_code, output)
+        waiting = st.empty()
+        if test_func is None:
+            if test_cases:
+                waiting.info(f"Running {len(test_cases)} test cases...")
+            verdict = grade_submission(
+                user_code,
+                solution_code,
+                function_name,
+                test_cases or (),
+                session_id=get_session_id(),
+                on_queue=show_queue_position(waiting),
+                requires=requires or (),
+                benchmark=benchmark,
+            )
         else:
-            # Simple solution comparison
-            solution_output, _, _ = execute_code(solution_code)
-            is_correct = output.strip() == solution_output.strip()
-        
-        if is_correct:
-            st.success("✅ Correct! Great job!")
-            return True
-        else:
-            st.error("❌ Your solution doesn't match the expected output. Try again!")
-            return False
+            problems = check_requirements(user_code, exercise_requirements(function_name, requires or ()))
+            if problems:
+                verdict = Verdict(False, "", "", None, problems=problems)
+            else:
+                # Use a custom testing function if provided
+                result = execute_code_result(user_code, on_queue=show_queue_position(waiting))
+                passed = not (result.exception or result.error) and bool(test_func(user_code, result.output))
+                verdict = Verdict(passed, result.output, result.error, result.exception, None, result.figures)
+        waiting.empty()
+        show_verdict(function_name, verdict)
+        get_progress_store().record(
+            get_learner_id(),
+            EVENT_PASS if verdict.passed else EVENT_ATTEMPT,
+            st.session_state.get("current_lesson"),
+            unique_id,
+        )
+        if verdict.passed:
+            passed_exercises[unique_id] = definition
+        # A failed retry doesn't take back an exercise that was already passed
+        return verdict.passed or already_passed
     
-    return False
+    if already_passed:
+        st.success("✅ You have already solved this exercise.")
+    return already_passed
+
+def kernel_mode_controls():
+    """Sidebar controls for keeping variables between code runs"""
+    st.sidebar.checkbox(
+        "Keep variables between runs (REPL mode)",
+        key="kernel_mode",
+        help="Code you run can use variables and imports from your earlier runs.",
+    )
+    if st.session_state.get("kernel_mode"):
+        if st.sidebar.button("Reset variables", key="reset_kernel"):
+            get_kernels().reset(get_session_id())
+            st.sidebar.success("Your variables have been cleared.")
 
 def lesson_ui(lesson_title, lesson_content_func):
     """Standard UI wrapper for lessons"""
     st.title(f"🐍 {lesson_title}")
+    kernel_mode_controls()
+    # Exercise checks are logged under this lesson
+    st.session_state.current_lesson = lesson_title
     
     # Check completion status
     is_completed = check_completion_status(lesson_title)
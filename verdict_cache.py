@@ -0,0 +1,139 @@
+"""Grading verdicts keyed by the logic of a submission.
+
+Students resubmit the same code many times, often with nothing changed
+but comments, formatting or docstrings. Submissions are normalized through
+the AST, so such resubmissions share a key and are answered from this
+cache instead of being run again. Verdicts are appended to a JSON Lines
+file, so they are shared by every session and survive restarts. Only the
+most recently used verdicts, up to a total size, are kept.
+"""
+import ast
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from result_cache import cache_key
+
+VERDICTS_PATH = Path(os.environ.get("VERDICTS_PATH", "verdicts.jsonl"))
+# Total size of the verdicts kept; the file may grow to twice this before it is compacted
+VERDICTS_CACHE_BYTES = int(os.environ.get("VERDICTS_CACHE_MB", 16)) * 1024 * 1024
+
+# Bump when grading changes so that verdicts from older rules are not reused
+VERDICT_VERSION = 3
+
+
+def _strip_docstrings(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+    return tree
+
+
+def normalize_submission(code_str):
+    """Dump of the code's AST without docstrings, or None if it doesn't parse
+
+    Comments, blank lines and formatting are not part of the AST, so they
+    disappear too.
+    """
+    try:
+        tree = ast.parse(code_str)
+    except (SyntaxError, ValueError):
+        return None
+    return ast.dump(_strip_docstrings(tree))
+
+
+def verdict_key(code_str, *exercise):
+    """Key of a submission to an exercise, or None if the submission doesn't parse"""
+    normalized = normalize_submission(code_str)
+    if normalized is None:
+        return None
+    return cache_key(normalized, VERDICT_VERSION, *exercise)
+
+
+class VerdictCache:
+    """LRU of verdicts by key, bounded by total size and appended to a JSON Lines file
+
+    Appending leaves evicted and replaced verdicts behind in the file, so
+    once it holds more than twice `max_bytes` it is rewritten with only the
+    retained verdicts, least recently used first.
+    """
+
+    def __init__(self, path=VERDICTS_PATH, max_bytes=VERDICTS_CACHE_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._verdicts = None
+        self._size = 0
+        self._file_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _add(self, key, verdict, line):
+        if key in self._verdicts:
+            self._size -= self._verdicts.pop(key)[1]
+        self._verdicts[key] = (verdict, len(line))
+        self._size += len(line)
+        while self._size > self.max_bytes:
+            _, (_, evicted_size) = self._verdicts.popitem(last=False)
+            self._size -= evicted_size
+
+    def _load(self):
+        if self._verdicts is None:
+            self._verdicts = OrderedDict()
+            try:
+                with open(self.path, "r") as f:
+                    for line in f:
+                        self._file_size += len(line)
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # A line cut short by a crash
+                        if len(line) <= self.max_bytes:
+                            self._add(entry["key"], entry["verdict"], line)
+            except OSError:
+                pass
+            if self._file_size > 2 * self.max_bytes:
+                self._compact()
+        return self._verdicts
+
+    def _compact(self):
+        # Write to a temp file and rename it so readers never see a partial file
+        lines = [json.dumps({"key": key, "verdict": verdict}) + "\n" for key, (verdict, _) in self._verdicts.items()]
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self._file_size = sum(len(line) for line in lines)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._load().get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._verdicts.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, verdict):
+        line = json.dumps({"key": key, "verdict": verdict}) + "\n"
+        if len(line) > self.max_bytes:
+            return
+        with self._lock:
+            self._load()
+            self._add(key, verdict, line)
+            with open(self.path, "a") as f:
+                f.write(line)
+            self._file_size += len(line)
+            if self._file_size > 2 * self.max_bytes:
+                self._compact()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())